@@ -0,0 +1,427 @@
+"""Benchmarks for the helper modules used in the notebooks.
+
+Run a single benchmark from the `myst-notebooks` folder, e.g.:
+
+    python benchmarks.py read_files
+
+Extra arguments are passed on to the benchmark function, e.g.:
+
+    python benchmarks.py sum_function 6
+
+Run without arguments to see the available benchmarks.
+"""
+
+import array
+import json
+import os
+import shutil
+import string
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import example_module
+import scraping_module
+import statistics_module
+import tweets_module
+
+
+def timed(function, *args, repeat=3, **kwargs):
+    """Run a function a few times and return the best wall-clock time.
+
+    Args:
+        function (callable): function to time
+        repeat (int): number of runs
+
+    Returns:
+        float: fastest run in seconds
+    """
+    best = float('inf')
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def make_corpus(target_folder, n_files, source_folder='data/gutenberg-extension'):
+    """Fill a folder with `n_files` copies of the Gutenberg books.
+
+    Copies are spread over subfolders of 100 files each.
+
+    Args:
+        target_folder (str): folder to write to
+        n_files (int): number of files to create
+        source_folder (str): folder with the books to copy
+
+    Returns:
+        str: the target folder
+    """
+    books = [os.path.join(source_folder, f) for f in sorted(os.listdir(source_folder))
+             if f.endswith('.txt')]
+
+    for i in range(n_files):
+        subfolder = os.path.join(target_folder, f'part-{i // 100:04d}')
+        os.makedirs(subfolder, exist_ok=True)
+
+        book = books[i % len(books)]
+        shutil.copyfile(book, os.path.join(subfolder, f'{i:06d}-{os.path.basename(book)}'))
+
+    return target_folder
+
+
+def bench_read_files(n_files=3000):
+    """Serial `os.walk` loop against the parallel loaders."""
+
+    def consume(iterable):
+        for _ in iterable:
+            pass
+
+    with tempfile.TemporaryDirectory() as folder:
+        n_files = int(n_files)
+        make_corpus(folder, n_files)
+        print(f"Reading {n_files} files")
+
+        serial = timed(example_module.read_files, folder)
+        print(f"{'serial read_files':<35}{serial:8.3f} s")
+
+        for processes in (False, True):
+            for ordered in (True, False):
+                seconds = timed(consume, example_module.read_files_parallel(
+                    folder, processes=processes, ordered=ordered), repeat=1)
+                name = f"{'processes' if processes else 'threads'}, " \
+                       f"{'ordered' if ordered else 'unordered'}"
+                print(f"{name:<35}{seconds:8.3f} s  ({serial / seconds:.1f}x)")
+
+
+def bench_sum_function(max_exponent=8):
+    """Python loop against `sum_function` for 10^3 up to 10^max_exponent values."""
+
+    def sum_loop(values):
+        result = 0
+        for i in values:
+            result += i
+        return result
+
+    print(f"{'n':>10}{'input':>14}{'loop':>10}{'sum_function':>14}{'speedup':>9}")
+
+    for exponent in range(3, int(max_exponent) + 1):
+        n = 10**exponent
+        numbers = np.random.default_rng(exponent).random(n)
+        inputs = {
+            'ndarray': numbers,
+            'array.array': array.array('d', numbers.tobytes()),
+        }
+        repeat = 3 if exponent < 7 else 1
+
+        for name, values in inputs.items():
+            loop = timed(sum_loop, values, repeat=repeat)
+            vectorized = timed(example_module.sum_function, values, repeat=repeat)
+            print(f"{n:>10}{name:>14}{loop:>9.4f}s{vectorized:>13.4f}s{loop / vectorized:>8.0f}x")
+
+        if exponent <= 7:  # bigger generators take minutes in the Python loop
+            loop = timed(sum_loop, (x for x in range(n)), repeat=1)
+            chunked = timed(example_module.sum_function, (x for x in range(n)), repeat=1)
+            print(f"{n:>10}{'generator':>14}{loop:>9.4f}s{chunked:>13.4f}s{loop / chunked:>8.1f}x")
+
+
+def bench_corpus_statistics(n_files=1000):
+    """First run of `corpus_statistics` against a rerun on the unchanged corpus."""
+
+    with tempfile.TemporaryDirectory() as folder:
+        n_files = int(n_files)
+        corpus = make_corpus(os.path.join(folder, 'corpus'), n_files)
+        target = os.path.join(folder, 'statistics.json')
+        print(f"Statistics for {n_files} files")
+
+        first = timed(statistics_module.corpus_statistics, corpus, target, repeat=1)
+        print(f"{'first run':<35}{first:8.3f} s")
+
+        rerun = timed(statistics_module.corpus_statistics, corpus, target)
+        print(f"{'rerun, nothing changed':<35}{rerun:8.3f} s")
+
+        os.utime(os.path.join(corpus, 'part-0000', os.listdir(os.path.join(corpus, 'part-0000'))[0]))
+        touched = timed(statistics_module.corpus_statistics, corpus, target, repeat=1)
+        print(f"{'rerun, one file touched':<35}{touched:8.3f} s")
+
+
+def bench_unique_estimate(folder='data/gutenberg-extension'):
+    """Accuracy of the HyperLogLog `n_unique` estimate against the exact numbers."""
+
+    precisions = (10, 12, 14)
+    header = "".join(f"{f'p={p} ({2**p // 1024} KB)':>18}" for p in precisions)
+    print(f"{'file':<26}{'exact':>8}{header}")
+
+    corpus = statistics_module.WordStatistics()
+    sketches = {p: statistics_module.HyperLogLog(p) for p in precisions}
+
+    for file_path, text in example_module.iter_files(folder):
+        if not file_path.endswith('.txt'):
+            continue
+
+        exact = statistics_module.WordStatistics(text)
+        corpus.merge(exact)
+        row = f"{os.path.basename(file_path):<26}{exact.n_unique:>8}"
+
+        for p in precisions:
+            sketch = statistics_module.HyperLogLog(p)
+            sketch.update(exact.counts)
+            sketches[p].merge(sketch)
+            error = (len(sketch) - exact.n_unique) / exact.n_unique
+            row += f"{len(sketch):>10}{error:>+8.1%}"
+
+        print(row)
+
+    row = f"{'all books (merged)':<26}{corpus.n_unique:>8}"
+    for p in precisions:
+        error = (len(sketches[p]) - corpus.n_unique) / corpus.n_unique
+        row += f"{len(sketches[p]):>10}{error:>+8.1%}"
+    print(row)
+
+
+def bench_tokenize_tweets(scale=100, n_workers=None):
+    """`df.text.apply(tokenize_tweet)` as in the notebook against `tokenize_tweets`."""
+    import pandas as pd
+    from nltk.tokenize import TweetTokenizer
+
+    tokenizer = TweetTokenizer(preserve_case=True, reduce_len=False, strip_handles=False)
+
+    def notebook_tokenize_tweet(tweet):
+        # Copied from notebook 5
+        normalized = []
+        for token in tokenizer.tokenize(tweet):
+            if token in string.punctuation:
+                continue
+            elif len(token) <= 3:
+                continue
+            elif token.startswith(('http', 'www')):
+                continue
+            else:
+                normalized.append(token)
+        return " ".join(normalized)
+
+    texts = pd.read_csv('data/elonmusk_tweets.csv', encoding='utf-8')['text']
+
+    # fast_tokenize relies on NLTK internals, so check it still gives the same tokens
+    different = [tweet for tweet in texts
+                 if tweets_module.fast_tokenize(tweet, tokenizer) != tokenizer.tokenize(tweet)]
+    if different:
+        raise AssertionError(f"fast_tokenize differs from TweetTokenizer on {len(different)} tweets, "
+                             f"e.g. {different[0]!r}")
+
+    texts = pd.concat([texts] * int(scale), ignore_index=True)
+    n_workers = int(n_workers) if n_workers else os.cpu_count() or 1
+    print(f"Tokenizing {len(texts)} tweets")
+
+    apply = timed(texts.apply, notebook_tokenize_tweet, repeat=1)
+    print(f"{'apply(tokenize_tweet)':<35}{apply:8.3f} s")
+
+    batch = timed(tweets_module.tokenize_tweets, texts, repeat=1)
+    print(f"{'tokenize_tweets':<35}{batch:8.3f} s  ({apply / batch:.1f}x)")
+
+    if n_workers > 1:
+        parallel = timed(tweets_module.tokenize_tweets, texts, n_workers=n_workers, repeat=1)
+        print(f"{f'tokenize_tweets, {n_workers} processes':<35}{parallel:8.3f} s  ({apply / parallel:.1f}x)")
+
+
+def bench_extract_entities(n_rows=10_000_000):
+    """`find_mentions` with `apply` as in notebook 4 against `extract_entities`."""
+    import re
+
+    import pandas as pd
+
+    def find_mentions(tweet):
+        # Copied from notebook 4
+        return re.findall(r'@[a-zA-Z0-9_]{1,15}', tweet)
+
+    texts = pd.read_csv('data/elonmusk_tweets.csv', encoding='utf-8')['text']
+    texts = pd.concat([texts] * -(-int(n_rows) // len(texts)), ignore_index=True)[:int(n_rows)]
+    print(f"Extracting entities from {len(texts)} tweets")
+
+    def notebook_mentions():
+        tweet_mentions = texts.apply(find_mentions)
+        return tweet_mentions, tweet_mentions.apply(len)
+
+    def notebook_entities():
+        return [texts.apply(pattern.findall).apply(len) for pattern in tweets_module.ENTITY_PATTERNS.values()]
+
+    apply = timed(notebook_mentions, repeat=1)
+    print(f"{'apply(find_mentions), apply(len)':<35}{apply:8.3f} s")
+
+    apply_all = timed(notebook_entities, repeat=1)
+    print(f"{'apply(findall) for all entities':<35}{apply_all:8.3f} s")
+
+    long_table = timed(tweets_module.extract_entities, texts, repeat=1)
+    print(f"{'extract_entities':<35}{long_table:8.3f} s  ({apply_all / long_table:.1f}x)")
+
+    columns = timed(tweets_module.extract_entities, texts, return_columns=True, repeat=1)
+    print(f"{'extract_entities, with columns':<35}{columns:8.3f} s  ({apply_all / columns:.1f}x)")
+
+
+def bench_mention_graph(n_rows=10_000_000):
+    """`explode` and `value_counts` of the mentions against `MentionGraph`."""
+    import pandas as pd
+
+    df = pd.read_csv('data/elonmusk_tweets.csv', encoding='utf-8', parse_dates=['created_at'])
+    df = pd.concat([df] * -(-int(n_rows) // len(df)), ignore_index=True)[:int(n_rows)]
+    df['tweet_mentions'] = tweets_module.extract_entities(df['text'], return_columns=True)[1]['tweet_mentions']
+    window = (df['created_at'] >= '2017-01-01') & (df['created_at'] < '2017-04-01')
+
+    def notebook_top_mentioned():
+        return (df['tweet_mentions'].explode().value_counts().head(10),
+                df.loc[window, 'tweet_mentions'].explode().value_counts().head(10))
+
+    explode = timed(notebook_top_mentioned, repeat=1)
+    print(f"{'explode().value_counts()':<35}{explode:8.3f} s")
+
+    build = timed(tweets_module.MentionGraph.from_frame, df, 'elonmusk', repeat=1)
+    graph = tweets_module.MentionGraph.from_frame(df, 'elonmusk')
+    print(f"{f'MentionGraph ({graph.n_edges} edges)':<35}{build:8.3f} s")
+
+    def graph_top_mentioned():
+        return graph.top_mentioned(10), graph.top_mentioned(10, start='2017-01-01', end='2017-04-01')
+
+    query = timed(graph_top_mentioned)
+    print(f"{'MentionGraph.top_mentioned':<35}{query:8.3f} s  ({explode / query:.1f}x)")
+
+
+def bench_read_columns(n_rows=10_000_000):
+    """`read_pickle` of the enhanced frame against `read_columns`."""
+    import pandas as pd
+
+    df = pd.read_csv('data/elonmusk_tweets.csv', encoding='utf-8', parse_dates=['created_at'])
+    df = pd.concat([df] * -(-int(n_rows) // len(df)), ignore_index=True)[:int(n_rows)]
+    columns = tweets_module.extract_entities(df['text'], return_columns=True)[1]
+    df[['tweet_mentions', 'n_mentions']] = columns[['tweet_mentions', 'n_mentions']]
+    print(f"Reading {len(df)} tweets")
+
+    with tempfile.TemporaryDirectory() as folder:
+        pickle_path, columns_path = os.path.join(folder, 'tweets.pickle'), os.path.join(folder, 'tweets')
+
+        write_pickle = timed(df.to_pickle, pickle_path, repeat=1)
+        write_columns = timed(tweets_module.write_columns, df, columns_path, repeat=1)
+        print(f"{'to_pickle':<35}{write_pickle:8.3f} s")
+        print(f"{'write_columns':<35}{write_columns:8.3f} s")
+        del df
+
+        read_pickle = timed(pd.read_pickle, pickle_path, repeat=1)
+        print(f"{'read_pickle':<35}{read_pickle:8.3f} s")
+
+        for label, kwargs in [('read_columns', {}),
+                              ('read_columns, 2 columns', {'columns': ['created_at', 'n_mentions']}),
+                              ('read_columns, 2 columns, 2017', {'columns': ['created_at', 'n_mentions'],
+                                                                 'start': '2017-01-01', 'end': '2018-01-01'})]:
+            read = timed(tweets_module.read_columns, columns_path, repeat=1, **kwargs)
+            print(f"{label:<35}{read:8.3f} s  ({read_pickle / read:.1f}x)")
+
+
+def bench_extract_links(folder='data/wikipedia', rounds=100):
+    """`get_links` (BeautifulSoup) against `iter_article_links` on saved Wikipedia pages.
+
+    The pages in data/wikipedia are small made-up ones; for numbers that
+    hold for real articles, save some (as <Name>.html) in another folder
+    and pass it, e.g. `python benchmarks.py extract_links stuff/articles 1`.
+    """
+    pages = [open(file_path, 'rb').read()
+             for file_path in example_module.list_files(folder) if file_path.endswith('.html')]
+    pages = pages * int(rounds)
+    n_bytes = sum(len(page) for page in pages)
+    print(f"Extracting links from {len(pages)} pages ({n_bytes / 2**20:.1f} MB)")
+
+    def soup_links():
+        return [[link.attrs['href'] for link in scraping_module.get_links('', page=page)] for page in pages]
+
+    def fast_links():
+        return [list(scraping_module.iter_article_links(page)) for page in pages]
+
+    assert soup_links() == fast_links()
+
+    soup = timed(soup_links, repeat=1)
+    print(f"{'get_links':<35}{soup:8.3f} s  {len(pages) / soup:8.0f} pages/s")
+
+    fast = timed(fast_links)
+    print(f"{'iter_article_links':<35}{fast:8.3f} s  {len(pages) / fast:8.0f} pages/s  ({soup / fast:.1f}x)")
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    """Answer every GET with a small JSON document, like an API would."""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # else small answers on an open connection wait for an ACK
+    latency = 0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        body = json.dumps({'path': self.path, 'ok': True}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_pooled_session(n_requests=2000, n_workers=8, latency_ms=0):
+    """`requests.get` against `PooledSession`, on a stub API server on this computer.
+
+    `latency_ms` makes the server wait before every answer, like a server
+    far away would.
+    """
+    import requests
+
+    handler = type('_SlowJSONHandler', (_JSONHandler,), {'latency': int(latency_ms) / 1000})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f'http://127.0.0.1:{server.server_address[1]}/items/{i}' for i in range(int(n_requests))]
+    print(f"{len(urls)} GET requests to a local stub server ({latency_ms} ms latency)")
+
+    def without_pooling():
+        return [requests.get(url, timeout=10).json() for url in urls]
+
+    def with_pooling():
+        with scraping_module.PooledSession() as session:
+            return [session.get(url).json() for url in urls]
+
+    def parallel():
+        with scraping_module.PooledSession(max_connections=int(n_workers)) as session:
+            return session.get_many(urls)
+
+    try:
+        for label, function in [('requests.get', without_pooling),
+                                ('PooledSession.get', with_pooling),
+                                (f'PooledSession.get_many, {n_workers} threads', parallel)]:
+            seconds = timed(function, repeat=1)
+            print(f"{label:<35}{seconds:8.3f} s  {len(urls) / seconds:8.0f} requests/s")
+    finally:
+        server.shutdown()
+
+
+BENCHMARKS = {
+    'read_files': bench_read_files,
+    'sum_function': bench_sum_function,
+    'corpus_statistics': bench_corpus_statistics,
+    'unique_estimate': bench_unique_estimate,
+    'tokenize_tweets': bench_tokenize_tweets,
+    'extract_entities': bench_extract_entities,
+    'mention_graph': bench_mention_graph,
+    'read_columns': bench_read_columns,
+    'extract_links': bench_extract_links,
+    'pooled_session': bench_pooled_session,
+}
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print("Available benchmarks:", ", ".join(BENCHMARKS))
+        sys.exit(1)
+
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
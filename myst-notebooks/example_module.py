@@ -1,44 +1,347 @@
+import array
+import itertools
+import math
+import mmap
 import os
+import re
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
+import numpy as np
 
-def read_files(path):
+
+def list_files(path):
+    """List the paths of all files in a folder and its subfolders.
+
+    Args:
+        path (str): path to the folder
+
+    Yields:
+        str: file path, in a predictable (sorted) order
+    """
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()  # walk the folders in a predictable order
+
+        for f in sorted(files):
+            yield os.path.join(root, f)
+
+
+def _read_file(file_path):
+    """Read and decode a single file (used by the worker pools)."""
+
+    with open(file_path, 'rb') as infile:
+        return file_path, infile.read().decode('utf-8')
+
+
+def iter_files(path, chunk_size=None):
+    """Lazily read all files in a folder and its subfolders.
+
+    Files are opened one at a time, so only the file (or chunk) that is
+    currently being processed has to fit in memory.
+
+    Args:
+        path (str): path to the folder
+        chunk_size (int, optional): if given, read each file in chunks of
+            roughly this many characters instead of all at once (see
+            `read_chunks`)
+
+    Yields:
+        tuple: (file path, content as string) for every file, or for
+            every chunk of every file if `chunk_size` is given
+    """
+
+    for file_path in list_files(path):
+
+        if chunk_size is None:
+            with open(file_path, encoding='utf-8') as infile:
+                yield file_path, infile.read()
+            continue
+
+        for chunk in read_chunks(file_path, chunk_size):
+            yield file_path, chunk
+
+
+# Chunks are extended up to the first whitespace character
+WHITESPACE_RE = re.compile(r'\s')
+
+
+def read_chunks(file_path, chunk_size, max_extension=None):
+    """Read a file in chunks that end on whitespace.
+
+    Example:
+        >>> import tempfile
+        >>> with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as outfile:
+        ...     _ = outfile.write('The quick brown fox\\njumps')
+        >>> list(read_chunks(outfile.name, 6))
+        ['The quick ', 'brown fox\\n', 'jumps']
+        >>> os.remove(outfile.name)
+
+    Args:
+        file_path (str): path to the file
+        chunk_size (int): read roughly this many characters at a time; the
+            chunk is extended to the next whitespace character, so that
+            words are not split between two chunks
+        max_extension (int, optional): extend a chunk by at most this many
+            characters (default: `chunk_size`), so that a file without
+            whitespace is still read in pieces of bounded size; only words
+            longer than this are split
+
+    Yields:
+        str: the next chunk of the file
+    """
+    if max_extension is None:
+        max_extension = chunk_size
+
+    with open(file_path, encoding='utf-8') as infile:
+        rest = ''  # read while extending the previous chunk, but not part of it
+
+        while True:
+            chunk = rest + infile.read(chunk_size)
+            if not chunk:
+                break
+
+            rest = ''
+            if not chunk[-1].isspace():
+                extension = infile.read(max_extension)
+                match = WHITESPACE_RE.search(extension)
+                if match is not None:
+                    extension, rest = extension[:match.end()], extension[match.end():]
+                chunk += extension
+
+            yield chunk
+
+
+def read_files_parallel(path, n_workers=None, processes=False, ordered=True):
+    """Read all files in a folder and its subfolders using a worker pool.
+
+    Reading and UTF-8 decoding are spread over a pool of threads (the
+    default) or processes. Processes have to send every text back to the
+    main process, which is often slower than decoding it; see
+    `python benchmarks.py read_files` for the numbers on your machine.
+
+    Args:
+        path (str): path to the folder
+        n_workers (int, optional): size of the pool, defaults to the
+            number of CPUs
+        processes (bool): use a process pool instead of a thread pool
+        ordered (bool): if True, yield the files in the same order as
+            `iter_files`; if False, yield each file as soon as it is read
+
+    Yields:
+        tuple: (file path, content as string) for every file
+    """
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    pool_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    file_paths = list(list_files(path))
+
+    with pool_class(max_workers=n_workers) as pool:
+
+        if ordered:
+            # Sending files in batches keeps the overhead of the process pool low
+            chunksize = max(1, len(file_paths) // (n_workers * 4))
+            yield from pool.map(_read_file, file_paths, chunksize=chunksize)
+        else:
+            futures = [pool.submit(_read_file, p) for p in file_paths]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+def read_files(path, lazy=False, chunk_size=None):
     """Read all files in a folder and its subfolders.
 
+    Files are read in the sorted order of `list_files`, with or without
+    `lazy`.
+
     Args:
         path (str): path to the folder
+        lazy (bool): if True, return a generator of (file path, content)
+            pairs instead of a dictionary (see `iter_files`). Use this
+            for corpora that do not fit in memory.
+        chunk_size (int, optional): only used when `lazy` is True, see
+            `iter_files`
 
     Returns:
-        dict: dictionary of filename (key) and content as string (value)
+        dict: dictionary of file path relative to `path` (key) and content
+            as string (value), or a generator of such pairs if `lazy` is
+            True
     """
 
-    file2content = dict()
+    if lazy:
+        return ((os.path.relpath(file_path, path), text)
+                for file_path, text in iter_files(path, chunk_size=chunk_size))
 
-    for root, dirs, files in os.walk(path):
-        for f in files:
+    file2content = dict()
 
-            file_path = os.path.join(root, f)
-            with open(file_path, encoding='utf-8') as infile:
-                text = infile.read()
+    for file_path in list_files(path):
+        with open(file_path, encoding='utf-8') as infile:
+            text = infile.read()
 
-                file2content[f] = text
+            # Key by relative path: files with the same name in
+            # different subfolders would otherwise overwrite each other
+            file2content[os.path.relpath(file_path, path)] = text
 
     return file2content
 
 
-def sum_function(values):
-    """Sum the values in a list. 
+class DocumentStore(Mapping):
+    """Read-only dictionary of the files in a folder and its subfolders.
+
+    Keys are file paths relative to the folder, like in `read_files`, but
+    nothing is read when the store is created. A file is memory-mapped the
+    first time it is accessed and only decoded to a string when its value
+    is asked for, so opening a store on a large corpus is cheap. Only the
+    `max_open` most recently used files are kept mapped (each map holds a
+    file descriptor); older ones are closed when a new file is mapped.
+
+    Example:
+        >>> store = DocumentStore('data/gutenberg-extension')
+        >>> list(store)[:2]
+        ['README', 'austen-pride.txt']
+        >>> text = store['doyle-sherlock.txt']
+    """
+
+    def __init__(self, path, encoding='utf-8', max_open=64):
+        """
+        Args:
+            path (str): path to the folder
+            encoding (str): encoding used to decode the files
+            max_open (int): number of files to keep memory-mapped at once
+        """
+        self.path = path
+        self.encoding = encoding
+        self.max_open = max_open
+        self._paths = [os.path.relpath(p, path) for p in list_files(path)]
+        self._known = set(self._paths)
+        self._maps = OrderedDict()
+
+    def raw(self, key):
+        """Return the undecoded contents of a file without copying them.
+
+        The map stays valid until the file is evicted (after `max_open`
+        other files have been mapped) or the store is closed.
+
+        Args:
+            key (str): file path relative to the folder
+
+        Returns:
+            mmap.mmap or bytes: memory-mapped file (empty files cannot be
+                mapped and give `b''`)
+        """
+        if key not in self._known:
+            raise KeyError(key)
+
+        if key in self._maps:
+            self._maps.move_to_end(key)
+            return self._maps[key]
+
+        while len(self._maps) >= self.max_open:
+            _, evicted = self._maps.popitem(last=False)
+            if isinstance(evicted, mmap.mmap):
+                evicted.close()
+
+        with open(os.path.join(self.path, key), 'rb') as infile:
+            if os.fstat(infile.fileno()).st_size == 0:
+                self._maps[key] = b''
+            else:
+                self._maps[key] = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return self._maps[key]
+
+    def __getitem__(self, key):
+        return str(self.raw(key)[:], self.encoding)
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __contains__(self, key):
+        return key in self._known
+
+    def close(self):
+        """Release all memory-mapped files."""
+        for mapped in self._maps.values():
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        self._maps.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def sum_function(values, exact=False, chunk_size=2**20):
+    """Sum the values in a list, array or iterator.
+
+    NumPy arrays and `array.array` objects are summed with NumPy, without
+    copying them. Lists, tuples and other iterables (e.g. generators) are
+    summed with the built-in `sum`, which is faster than converting them to
+    an array first and takes one value at a time from an iterator, so the
+    values never have to fit in memory.
+
+    Integer input always gives the exact result, also when it does not fit
+    in 64 bits.
+
+    Example:
+        >>> sum_function([2**63, 1], exact=True)
+        9223372036854775809
+        >>> sum_function([0.1] * 10, exact=True)
+        1.0
 
     Args:
-        values (list): List of numbers
+        values (list): List (or array, or iterable) of numbers
+        exact (bool): if True, sum floating point input with `math.fsum`,
+            which gives the correctly rounded sum (for an iterator, its
+            first value decides whether the input is floating point)
+        chunk_size (int): number of integers summed at a time when an
+            array's sum may not fit in 64 bits
 
     Returns:
-        int: Sum of values
+        int: Sum of values (a float for floating point input)
     """
-    result = 0
+    if isinstance(values, array.array):
+        values = np.frombuffer(values, dtype=values.typecode) if len(values) else np.asarray(values)
+
+    if isinstance(values, np.ndarray):
+        values = values.ravel()
+        if exact and values.dtype.kind == 'f':
+            return math.fsum(values)
+        return _sum_array(values, chunk_size)
+
+    if isinstance(values, (list, tuple)):
+        if exact and not all(isinstance(value, int) for value in values):
+            return math.fsum(values)
+        return sum(values)
+
+    iterator = iter(values)
+    first = next(iterator, 0)
+    if exact and isinstance(first, float):
+        return math.fsum(itertools.chain([first], iterator))
+    return sum(iterator, first)
 
-    for i in values:
-        result += i
-    return result
+
+def _sum_array(values, chunk_size):
+    """Sum a one-dimensional NumPy array without integer overflow."""
+
+    if values.dtype.kind not in 'iu' or values.size == 0:
+        return values.sum().item()
+
+    # NumPy sums integers in 64 bits, which silently wraps around on
+    # overflow. Only use it when the result is guaranteed to fit.
+    largest = max(abs(int(values.min())), abs(int(values.max())))
+    if largest * values.size < 2**63:
+        return int(values.sum(dtype=np.int64))
+
+    return sum(sum(values[i:i + chunk_size].tolist())
+               for i in range(0, values.size, chunk_size))
 
 
 if __name__ == "__main__":
@@ -52,3 +355,9 @@ if __name__ == "__main__":
     # Second example
     data = read_files('data')
     print(f"Read {len(data)} files")
+
+    # Third example: one file at a time, in chunks
+    n_chunks = 0
+    for file_path, chunk in read_files('data', lazy=True, chunk_size=2**16):
+        n_chunks += 1
+    print(f"Read {n_chunks} chunks")
@@ -0,0 +1,817 @@
+import asyncio
+import hashlib
+import html
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urljoin, urlsplit
+from urllib.request import urlopen
+
+import numpy as np
+import requests
+from bs4 import BeautifulSoup
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+WIKIPEDIA_URL = 'http://en.wikipedia.org'
+
+# Links to other articles: they start with /wiki/ and have no colon
+# (which would be e.g. a category, file or talk page)
+ARTICLE_RE = re.compile(r"^(/wiki/)((?!:).)*$")
+
+
+def get_links(article_url, base_url=WIKIPEDIA_URL, page=None):
+    """
+    Retrieve all URLs on an English Wikipedia article page (e.g. /wiki/Amsterdam).
+
+    This function needs a relative URL on the
+    http://en.wikipedia.org domain, such as '/wiki/Amsterdam'.
+
+    Args:
+        article_url (str): URL of a website
+        base_url (str): website the article is on (e.g. a local copy)
+        page (bytes or str, optional): HTML of the page if it was already
+            downloaded; then it is not fetched again
+
+    Returns:
+        bs4.element.ResultSet: bs link elements resultset
+    """
+    if page is None:
+        page = urlopen(base_url + article_url)
+    soup = BeautifulSoup(page, "lxml")
+
+    body = soup.find("div", {"id": "bodyContent"})
+    if body is None:
+        return []
+
+    return body.find_all("a", href=ARTICLE_RE)
+
+
+# For `iter_article_links`: the tags that matter. Comments and elements
+# whose contents lxml reads as plain text (scripts, styles, textareas, ...)
+# are matched as a whole, so tags inside them are skipped, like BeautifulSoup
+# does; after <plaintext> everything is text. Quoted attribute values may
+# contain '>', so they are matched as a whole too.
+TAG_RE = re.compile(r"""<!--.*?-->|<(script|style|textarea|title|xmp|iframe|noembed|noframes)\b.*?</\1\s*>"""
+                    r"""|<plaintext\b.*|<(/?)(div|a)(?=[\s>/])((?:"[^"]*"|'[^']*'|[^'">])*)>""",
+                    re.IGNORECASE | re.DOTALL)
+ATTRIBUTE_RE = re.compile(r"""([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+)))?""")
+
+
+def _attributes(text):
+    """Parse the attributes of a tag into a dict; the first of duplicates counts, like in lxml.
+
+    Also returns whether the tag closes itself (e.g. `<div/>`, which lxml
+    reads as an empty div).
+    """
+    attributes = dict()
+    end = 0
+    for match in ATTRIBUTE_RE.finditer(text):
+        name = match.group(1).lower()
+        if name not in attributes:
+            value = match.group(2) if match.group(2) is not None else match.group(3) or match.group(4) or ''
+            attributes[name] = html.unescape(value)
+        end = match.end()
+
+    # A '/' at the end belongs to an unquoted value (`<div class=x/>`) if an attribute ends there
+    return attributes, text.endswith('/') and end < len(text)
+
+
+def iter_article_links(page):
+    """Find the links to other articles in a Wikipedia page, without BeautifulSoup.
+
+    Gives the same links as `get_links`, but scans the HTML once with
+    regular expressions instead of building the whole tree of the page,
+    and only keeps track of how deep it is in `div#bodyContent`. Broken
+    HTML that lxml repairs (e.g. a `</div>` that closes nothing) can still
+    give different links.
+
+    Example:
+        >>> page = '<!-- <div id="bodyContent"> --><div id="bodyContent"><a title="1 > 0" href="/wiki/X">x</a></div>'
+        >>> list(iter_article_links(page))
+        ['/wiki/X']
+
+    Args:
+        page (bytes or str): HTML of the page
+
+    Yields:
+        str: the href of every link to an article, in order
+    """
+    if isinstance(page, bytes):
+        page = page.decode('utf-8', errors='replace')
+
+    depth = 0  # number of open divs inside the body, including itself
+    for match in TAG_RE.finditer(page):
+        closing, tag = match.group(2), match.group(3)
+        if tag is None:
+            continue  # comment, script, style, ...
+
+        if tag.lower() == 'div':
+            if closing:
+                if depth:
+                    depth -= 1
+                    if depth == 0:
+                        return
+                continue
+
+            attributes, self_closing = _attributes(match.group(4))
+            if depth == 0:
+                if attributes.get('id') == 'bodyContent':
+                    if self_closing:
+                        return
+                    depth = 1
+            elif not self_closing:
+                depth += 1
+
+        elif depth and not closing:
+            href = _attributes(match.group(4))[0].get('href')
+            if href is not None and ARTICLE_RE.match(href):
+                yield href
+
+
+class _ArticleHandler(SimpleHTTPRequestHandler):
+    """Serve /wiki/<Name> from the file <Name>.html in a folder."""
+
+    protocol_version = 'HTTP/1.1'  # keep connections open between requests
+    disable_nagle_algorithm = True  # else small answers on an open connection wait for an ACK
+
+    def translate_path(self, path):
+        path = unquote(urlsplit(path).path)
+        if path.startswith('/wiki/'):
+            path = path[len('/wiki/'):] + '.html'
+        return os.path.join(self.directory, os.path.basename(path))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_folder(folder='data/wikipedia', port=0):
+    """Serve saved Wikipedia pages over HTTP on this computer, in the background.
+
+    Example:
+        server, base_url = serve_folder('data/wikipedia')
+        links = get_links('/wiki/Chris_Cornell', base_url=base_url)
+        server.shutdown()
+
+    Args:
+        folder (str): folder with a file <Name>.html for every /wiki/<Name>
+        port (int): port to listen on (0 picks a free one)
+
+    Returns:
+        tuple: the server (stop it with `server.shutdown()`) and its base URL
+    """
+    handler = partial(_ArticleHandler, directory=os.path.abspath(folder))
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+class PooledSession(requests.Session):
+    """A `requests.Session` that reuses connections, retries and times out.
+
+    `requests.get` opens a new connection for every call. A session keeps
+    up to `max_connections` connections per host open (keep-alive) and
+    reuses them. Requests that fail because of the connection, or with a
+    status that means "try again later" (429, 500, 502, 503, 504), are
+    retried up to `retries` times, waiting longer after every failure.
+    Every request gets a `timeout`, unless one is given.
+
+    Example:
+        with PooledSession() as session:
+            r = session.get('https://api.github.com')
+            results = session.get_many(['https://api.github.com/users/octocat',
+                                        'https://api.github.com/users/torvalds'])
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, max_connections=10, retries=3, backoff=0.5, timeout=10):
+        """
+        Args:
+            max_connections (int): connections to keep open per host
+            retries (int): number of retries of a failed request
+            backoff (float): the first retry is immediate, retry n (n >= 2)
+                waits `backoff * 2**(n - 1)` seconds, so 0, 1 and 2 seconds
+                for the default 0.5
+            timeout (float): seconds to wait for the server
+        """
+        super().__init__()
+        self.max_connections = max_connections
+        self.timeout = timeout
+
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=self.RETRY_STATUSES,
+                      allowed_methods=Retry.DEFAULT_ALLOWED_METHODS, raise_on_status=False)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections,
+                                                max_retries=retry)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+    def _get_json(self, url, params):
+        response = self.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def get_many(self, urls, params=None, return_exceptions=False):
+        """GET several URLs at the same time and parse the JSON they return.
+
+        Args:
+            urls (list): URLs to get
+            params (dict, optional): query parameters for every URL
+            return_exceptions (bool): put the exception of a failed request
+                in the results instead of raising it
+
+        Returns:
+            list: the parsed JSON of every URL, in the order of `urls`
+        """
+        with ThreadPoolExecutor(self.max_connections) as executor:
+            futures = [executor.submit(self._get_json, url, params) for url in urls]
+
+        results = []
+        for future in futures:
+            error = future.exception()
+            if error is not None and not return_exceptions:
+                raise error
+            results.append(error if error is not None else future.result())
+        return results
+
+
+class OfflineError(requests.ConnectionError):
+    """A page is not in the cache, and the cache may not go online."""
+
+
+class ResponseCache:
+    """On-disk cache of web pages, that only downloads pages that changed.
+
+    Pages are kept in a SQLite database. A cached page younger than `ttl`
+    seconds is returned without any request. An older page is revalidated:
+    the server is asked for the page only if it changed since it was
+    cached (with the ETag and Last-Modified headers it sent), and answers
+    with a short "304 Not Modified" if it did not. When the cached pages
+    take more than `max_bytes`, the least recently used are removed. In
+    offline mode no requests are made at all.
+
+    Example:
+        with ResponseCache('stuff/pages.sqlite') as cache:
+            soup = BeautifulSoup(cache.get("http://www.pythonscraping.com/pages/page1.html").content, "lxml")
+    """
+
+    def __init__(self, path, ttl=24 * 3600, max_bytes=500 * 2**20, offline=False, session=None):
+        """
+        Args:
+            path (str): path to the database file (created if needed)
+            ttl (float): seconds during which a cached page is used as is
+            max_bytes (int): maximum total size of the cached pages
+            offline (bool): only use the cache, never the network
+            session (requests.Session, optional): session for the requests
+                (default: a new `PooledSession`)
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.session = session or PooledSession()
+
+        # The cache is also used from the threads of the crawler
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, status INTEGER, headers TEXT, '
+            'content BLOB, size INTEGER, fetched REAL, last_used INTEGER)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used)')
+        self._clock = self.connection.execute('SELECT MAX(last_used) FROM pages').fetchone()[0] or 0
+
+    def _lookup(self, url):
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT status, headers, content, fetched FROM pages WHERE url = ?', (url,)).fetchone()
+            if row is not None:
+                self._clock += 1
+                with self.connection:
+                    self.connection.execute('UPDATE pages SET last_used = ? WHERE url = ?', (self._clock, url))
+        return row
+
+    def _store(self, url, response):
+        headers = json.dumps(dict(response.headers))
+        with self._lock, self.connection:
+            self._clock += 1
+            self.connection.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, response.status_code, headers, response.content, len(response.content), time.time(),
+                 self._clock))
+            self._evict()
+
+    def _touch(self, url):
+        with self._lock, self.connection:
+            self.connection.execute('UPDATE pages SET fetched = ? WHERE url = ?', (time.time(), url))
+
+    def _evict(self):
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+        rows = self.connection.execute('SELECT url, size FROM pages ORDER BY last_used')
+
+        to_remove = []
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            to_remove.append((url,))
+            total -= size
+        self.connection.executemany('DELETE FROM pages WHERE url = ?', to_remove)
+
+    @staticmethod
+    def _response(url, status, headers, content):
+        response = requests.Response()
+        response.url = url
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(json.loads(headers))
+        response._content = content
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.from_cache = True
+        return response
+
+    def get(self, url, timeout=10):
+        """Get a page, from the cache if possible.
+
+        Args:
+            url (str): URL of the page
+            timeout (float): seconds to wait for the server
+
+        Returns:
+            requests.Response: the page; `response.from_cache` tells if it
+                came from the cache (also when the server said it had not
+                changed)
+        """
+        cached = self._lookup(url)
+
+        if cached is not None:
+            status, headers, content, fetched = cached
+            if self.offline or time.time() - fetched < self.ttl:
+                return self._response(url, status, headers, content)
+        elif self.offline:
+            raise OfflineError(f"{url} is not in the cache")
+
+        # Ask only for a changed page if the server told us how to recognize it
+        request_headers = dict()
+        if cached is not None:
+            cached_headers = CaseInsensitiveDict(json.loads(headers))
+            if 'ETag' in cached_headers:
+                request_headers['If-None-Match'] = cached_headers['ETag']
+            if 'Last-Modified' in cached_headers:
+                request_headers['If-Modified-Since'] = cached_headers['Last-Modified']
+
+        response = self.session.get(url, headers=request_headers, timeout=timeout)
+
+        if response.status_code == 304 and cached is not None:
+            self._touch(url)
+            return self._response(url, status, headers, content)
+
+        response.from_cache = False
+        if response.status_code == 200:
+            self._store(url, response)
+        return response
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BloomFilter:
+    """A set of strings that only remembers whether it (probably) has a string.
+
+    Every string sets `n_hashes` bits in a bit array. A string that was
+    added is always found; a string that was not added is found by mistake
+    with probability `error_rate`, as long as at most `capacity` strings
+    were added. Ten million URLs take 23 MB at an error rate of 1 in
+    10,000, instead of more than a GB in a Python set.
+
+    Example:
+        >>> seen = BloomFilter(capacity=1000, error_rate=0.01)
+        >>> seen.add(['/wiki/A', '/wiki/B', '/wiki/A']), seen.add(['/wiki/B', '/wiki/C'])
+        (['/wiki/A', '/wiki/B'], ['/wiki/C'])
+        >>> _ = seen.add(f'/wiki/{i}' for i in range(997))  # full up to its capacity
+        >>> import tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'seen.bloom')
+        >>> seen.save(path)
+        >>> loaded = BloomFilter.load(path)
+        >>> len(loaded), all(f'/wiki/{i}' in loaded for i in range(997))
+        (1000, True)
+        >>> sum(f'/wiki/other{i}' in loaded for i in range(10000)) / 10000  # wrongly taken for seen
+        0.0094
+    """
+
+    def __init__(self, capacity=10**7, error_rate=1e-4):
+        """
+        Args:
+            capacity (int): number of strings the filter is made for
+            error_rate (float): probability of a wrong "yes" at capacity
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.n_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self.bits = np.zeros((self.n_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, strings):
+        """Return the bit positions of some strings, one row per string."""
+        digests = b''.join(hashlib.blake2b(string.encode('utf-8'), digest_size=16).digest()
+                           for string in strings)
+        hashes = np.frombuffer(digests, dtype=np.uint64).reshape(-1, 2)
+
+        # Double hashing: the i-th position is h1 + i * h2 (modulo the number of bits)
+        steps = np.arange(self.n_hashes, dtype=np.uint64)
+        return (hashes[:, :1] + steps * hashes[:, 1:]) % np.uint64(self.n_bits)
+
+    def _has(self, positions):
+        return ((self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1).all(axis=1)
+
+    def add(self, strings):
+        """Add strings, and return which of them were new.
+
+        Args:
+            strings (list): the strings to add
+
+        Returns:
+            list: the strings that were not in the filter yet (in order,
+                without duplicates)
+        """
+        strings = list(dict.fromkeys(strings))
+        if not strings:
+            return []
+
+        positions = self._positions(strings)
+        new = ~self._has(positions)
+        positions = positions[new].ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+        self.count += int(new.sum())
+        return [string for string, is_new in zip(strings, new) if is_new]
+
+    def __contains__(self, string):
+        return bool(self._has(self._positions([string]))[0])
+
+    def __len__(self):
+        """Number of (probably) different strings added."""
+        return self.count
+
+    def save(self, path):
+        """Write the filter to a file, replacing it only once it is complete."""
+        with open(path + '.tmp', 'wb') as f:
+            header = json.dumps({'capacity': self.capacity, 'error_rate': self.error_rate, 'count': self.count})
+            f.write(header.encode('utf-8') + b'\n')
+            f.write(self.bits.tobytes())
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        """Read a filter written with `save`."""
+        with open(path, 'rb') as f:
+            settings = json.loads(f.readline())
+            bloom_filter = cls(settings['capacity'], settings['error_rate'])
+            bloom_filter.bits = np.frombuffer(f.read(), dtype=np.uint8).copy()
+        bloom_filter.count = settings['count']
+        return bloom_filter
+
+
+class _MemoryState:
+    """Frontier and visited articles of a crawl that is not kept on disk."""
+
+    def __init__(self):
+        self.frontier = deque()
+        self.seen = set()
+        self.links = dict()
+
+    def push(self, urls):
+        for url in urls:
+            if url not in self.seen:
+                self.seen.add(url)
+                self.frontier.append(url)
+
+    def pop(self):
+        return self.frontier.popleft() if self.frontier else None
+
+    def done(self, url, links):
+        if links is not None:
+            self.links[url] = links
+
+    def checkpoint(self):
+        pass
+
+
+class CrawlState:
+    """Frontier and visited articles of a crawl, kept on disk to continue later.
+
+    The frontier (articles still to visit) and the links of every visited
+    article are stored in a SQLite database in the folder `path`. Which
+    articles were already seen is kept in a `BloomFilter`, so the memory
+    use does not grow with the crawl; in rare cases (`error_rate`) an
+    article is taken for seen when it was not, and skipped.
+
+    Changes are saved at every `checkpoint`. After a crash, the crawl
+    continues from the last checkpoint: the articles that were being
+    fetched are put back in the frontier.
+
+    Example:
+        with CrawlState('stuff/crawl') as state:
+            asyncio.run(Crawler().crawl(['/wiki/Amsterdam'], max_pages=10000, state=state))
+
+        A crawl of the saved pages, stopped after 3 articles and while a
+        fourth was being fetched, and continued later:
+
+        >>> import tempfile
+        >>> server, base_url = serve_folder('data/wikipedia')
+        >>> crawler, folder = Crawler(base_url, requests_per_second=0, max_concurrency=1), tempfile.mkdtemp()
+        >>> with CrawlState(folder) as state:
+        ...     asyncio.run(crawler.crawl(['/wiki/Chris_Cornell'], max_pages=3, state=state)), state.pop()
+        (3, '/wiki/Audioslave')
+        >>> with CrawlState(folder) as state:
+        ...     state.n_queued, asyncio.run(crawler.crawl([], max_pages=100, state=state)), state.n_queued
+        (6, 15, 0)
+        >>> visited = asyncio.run(Crawler(base_url, requests_per_second=0).crawl(['/wiki/Chris_Cornell']))
+        >>> with CrawlState(folder) as state:  # the same as a crawl in one go
+        ...     all(state.links(url) == links for url, links in visited.items()), len(state) - len(visited)
+        (True, 9)
+        >>> server.shutdown()
+
+        The state also has the 9 (missing) disambiguation pages, which
+        could not be fetched.
+    """
+
+    def __init__(self, path, capacity=10**7, error_rate=1e-4):
+        """
+        Args:
+            path (str): folder for the state (created if needed); an
+                existing state in it is continued
+            capacity, error_rate: settings of a new `BloomFilter`
+        """
+        os.makedirs(path, exist_ok=True)
+        self.bloom_path = os.path.join(path, 'seen.bloom')
+        self.connection = sqlite3.connect(os.path.join(path, 'crawl.sqlite'))
+        self.connection.execute('CREATE TABLE IF NOT EXISTS frontier '
+                                '(position INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT, fetching INTEGER)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, links TEXT)')
+
+        # Articles that were being fetched at the last checkpoint are fetched again
+        self.connection.execute('UPDATE frontier SET fetching = 0')
+        self.connection.commit()
+        # Frontier position of the articles being fetched, to remove them by key
+        self._fetching = dict()
+
+        if os.path.exists(self.bloom_path):
+            self.seen = BloomFilter.load(self.bloom_path)
+        else:
+            self.seen = BloomFilter(capacity, error_rate)
+
+    def push(self, urls):
+        """Add the articles that were not seen before to the frontier."""
+        self.connection.executemany('INSERT INTO frontier (url, fetching) VALUES (?, 0)',
+                                    ((url,) for url in self.seen.add(urls)))
+
+    def pop(self):
+        """Return the next article to visit, or None if the frontier is empty."""
+        row = self.connection.execute(
+            'SELECT position, url FROM frontier WHERE fetching = 0 ORDER BY position LIMIT 1').fetchone()
+        if row is None:
+            return None
+
+        self.connection.execute('UPDATE frontier SET fetching = 1 WHERE position = ?', (row[0],))
+        self._fetching[row[1]] = row[0]
+        return row[1]
+
+    def done(self, url, links):
+        """Record a visited article and its links (None if it could not be fetched)."""
+        position = self._fetching.pop(url, None)
+        if position is not None:
+            self.connection.execute('DELETE FROM frontier WHERE position = ?', (position,))
+        self.connection.execute('INSERT OR REPLACE INTO pages VALUES (?, ?)',
+                                (url, None if links is None else json.dumps(links)))
+
+    def checkpoint(self):
+        """Save the state, so a crawl can continue from here."""
+        # The database first: if saving the filter fails, some articles may be
+        # queued twice, but none are forgotten
+        self.connection.commit()
+        self.seen.save(self.bloom_path)
+
+    def links(self, url):
+        """Return the links of a visited article (None if it could not be fetched)."""
+        row = self.connection.execute('SELECT links FROM pages WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            raise KeyError(url)
+        return None if row[0] is None else json.loads(row[0])
+
+    def __len__(self):
+        """Number of visited articles."""
+        return self.connection.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    @property
+    def n_queued(self):
+        """Number of articles in the frontier."""
+        return self.connection.execute('SELECT COUNT(*) FROM frontier').fetchone()[0]
+
+    def close(self):
+        self.checkpoint()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RateLimiter:
+    """Space out the requests to every host.
+
+    Each host gets at most `requests_per_second` requests per second; the
+    hosts are limited independently of each other.
+    """
+
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self._next_time = dict()
+
+    async def wait(self, host):
+        """Wait until the next request to a host is allowed."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+
+        # Reserve the next free slot of the host before waiting for it
+        slot = max(now, self._next_time.get(host, now))
+        self._next_time[host] = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+
+class Crawler:
+    """Crawl Wikipedia articles concurrently, starting from a few articles.
+
+    The random walk in the scraping notebook fetches one page at a time.
+    The crawler keeps a frontier queue of articles to visit, and several
+    workers take articles from it at the same time (at most
+    `max_concurrency` requests are underway). Links are extracted with
+    `get_links` (or, with `fast=True`, with `iter_article_links`), and
+    every article is visited only once. One
+    `requests.Session` is shared, so connections to a host are reused.
+
+    Example:
+        crawler = Crawler(max_concurrency=8, requests_per_second=5)
+        links = asyncio.run(crawler.crawl(['/wiki/Chris_Cornell'], max_pages=50))
+
+    In a notebook, which already runs an event loop, use
+    `links = await crawler.crawl(...)` instead of `asyncio.run`.
+    """
+
+    def __init__(self, base_url=WIKIPEDIA_URL, max_concurrency=8, requests_per_second=5, timeout=10,
+                 session=None, cache=None, fast=False):
+        """
+        Args:
+            base_url (str): website the articles are on
+            max_concurrency (int): maximum number of requests at the same time
+            requests_per_second (float): maximum requests per second per
+                host (0 for no limit); be kind to Wikipedia
+            timeout (float): seconds to wait for a response
+            session (requests.Session, optional): session to use for the
+                requests (default: a new `PooledSession`)
+            cache (ResponseCache, optional): get the pages through this
+                cache, so pages are only downloaded again if they changed
+            fast (bool): extract the links with `iter_article_links`
+                instead of `get_links` (the same links, except for broken
+                HTML that lxml repairs). It is about 12 times as fast on the
+                small pages in data/wikipedia; the gain on real articles
+                has not been measured, see `python benchmarks.py extract_links`
+        """
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.timeout = timeout
+
+        self.session = session or PooledSession(max_connections=max_concurrency, timeout=timeout)
+        self.cache = cache
+        self.fast = fast
+        self.errors = dict()
+
+    def _fetch(self, url):
+        if self.cache is not None:
+            response = self.cache.get(url, timeout=self.timeout)
+        else:
+            response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    async def fetch_links(self, article_url):
+        """Fetch an article and return the URLs of the articles it links to."""
+        url = urljoin(self.base_url, article_url)
+        if self.cache is None or not self.cache.offline:
+            await self.rate_limiter.wait(urlsplit(url).netloc)
+
+        # Requests and link extraction block, so they run in a thread
+        # (run_in_executor instead of asyncio.to_thread, which needs Python 3.9)
+        loop = asyncio.get_running_loop()
+        page = await loop.run_in_executor(None, self._fetch, url)
+        if self.fast:
+            return await loop.run_in_executor(None, lambda: list(iter_article_links(page)))
+
+        links = await loop.run_in_executor(None, get_links, article_url, self.base_url, page)
+        return [link.attrs['href'] for link in links]
+
+    async def crawl(self, start_urls, max_pages=100, state=None, checkpoint_every=1000):
+        """Visit articles breadth first, starting from some articles.
+
+        Args:
+            start_urls (list): article URLs to start from, e.g. ['/wiki/Amsterdam']
+            max_pages (int): maximum number of articles to fetch
+            state (CrawlState, optional): keep the frontier, the visited
+                articles and their links on disk, so a crawl can be
+                stopped and continued later with the same state
+            checkpoint_every (int): with a `state`, save it after this
+                many articles (and at the end)
+
+        Returns:
+            dict: URL of every visited article (key) and the URLs of the
+                articles it links to (value). Articles that could not be
+                fetched are in `errors` instead, with the exception. With
+                a `state`, the links are stored there instead, and the
+                number of articles visited in this call is returned.
+        """
+        crawl_state = _MemoryState() if state is None else state
+        crawl_state.push(start_urls)
+
+        # Workers wait here for new articles while others are still running
+        frontier_changed = asyncio.Condition()
+        n_started = n_running = n_visited = 0
+
+        async def worker():
+            nonlocal n_started, n_running, n_visited
+            while True:
+                async with frontier_changed:
+                    while True:
+                        url = crawl_state.pop() if n_started < max_pages else None
+                        if url is not None or n_running == 0:
+                            break
+                        await frontier_changed.wait()
+                    if url is None:
+                        frontier_changed.notify_all()
+                        return
+                    n_started += 1
+                    n_running += 1
+
+                try:
+                    links = await self.fetch_links(url)
+                    crawl_state.done(url, links)
+                    crawl_state.push(links)
+                except requests.RequestException as error:
+                    self.errors[url] = error
+                    crawl_state.done(url, None)
+                finally:
+                    async with frontier_changed:
+                        n_running -= 1
+                        n_visited += 1
+                        frontier_changed.notify_all()
+
+                if n_visited % checkpoint_every == 0:
+                    crawl_state.checkpoint()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.max_concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            crawl_state.checkpoint()
+
+        return crawl_state.links if state is None else n_visited
+
+
+if __name__ == "__main__":
+
+    # Crawl the saved pages in data/wikipedia, served on this computer
+    server, base_url = serve_folder('data/wikipedia')
+
+    crawler = Crawler(base_url, max_concurrency=4, requests_per_second=0)
+    visited = asyncio.run(crawler.crawl(['/wiki/Chris_Cornell'], max_pages=20))
+
+    for article, links in visited.items():
+        print(article, '->', ', '.join(links))
+    print(f"Visited {len(visited)} articles, {len(crawler.errors)} could not be fetched")
+
+    server.shutdown()
@@ -0,0 +1,489 @@
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+from example_module import list_files, read_chunks
+
+
+class MisraGries:
+    """Approximate word counts in a fixed amount of memory.
+
+    A Misra-Gries summary keeps at most `2 * capacity` counters between
+    updates (and briefly up to `3 * capacity` while it counts). Every word
+    that makes up more than `1 / (capacity + 1)` of all words is
+    guaranteed to be kept, and every kept count is at most `error` lower
+    than the true count, where `error <= n / (capacity + 1)` for `n` counted
+    words. Summaries can be merged with the same guarantee.
+
+    Example:
+        >>> summary = MisraGries(capacity=2)
+        >>> summary.update("a b a c a d a b".split()).most_common(1)
+        [('a', 4)]
+    """
+
+    def __init__(self, capacity=1000):
+        """
+        Args:
+            capacity (int): number of counters that are guaranteed to be kept
+        """
+        self.capacity = capacity
+        self.counts = Counter()
+        self.n = 0
+        self.error = 0
+
+    def update(self, tokens):
+        """Count a list of tokens (or add a `Counter` of token counts).
+
+        The tokens are counted in batches of `capacity` and the summary is
+        pruned after every batch, so it never holds more than
+        `3 * capacity` counters while counting, and at most `2 * capacity`
+        afterwards, however many tokens are added.
+
+        Returns:
+            MisraGries: the object itself
+        """
+        if isinstance(tokens, Counter):
+            items = iter(tokens.items())
+            batches = iter(lambda: Counter(dict(itertools.islice(items, self.capacity))), Counter())
+        else:
+            tokens = iter(tokens)
+            batches = iter(lambda: Counter(itertools.islice(tokens, self.capacity)), Counter())
+
+        for batch in batches:
+            self.counts.update(batch)
+            self.n += sum(batch.values())
+            self._prune()
+
+        return self
+
+    def merge(self, other):
+        """Add the counts of another summary to this one.
+
+        Returns:
+            MisraGries: the object itself
+        """
+        self.counts.update(other.counts)
+        self.n += other.n
+        self.error += other.error
+        self._prune()
+        return self
+
+    def _prune(self):
+        # Pruning only when twice the capacity is reached keeps it cheap
+        if len(self.counts) <= 2 * self.capacity:
+            return
+
+        threshold = heapq.nlargest(self.capacity + 1, self.counts.values())[-1]
+        self.counts = Counter({word: count - threshold
+                               for word, count in self.counts.items() if count > threshold})
+        self.error += threshold
+
+    def most_common(self, n=10):
+        """Return the `n` words with the highest (estimated) counts.
+
+        The counts are lower bounds: the true count is at most `error`
+        higher.
+        """
+        return heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])
+
+
+class HyperLogLog:
+    """Estimate the number of unique words in a few kilobytes.
+
+    A HyperLogLog sketch with precision `p` uses `2**p` one-byte registers
+    and estimates the number of distinct words with a typical relative
+    error of `1.04 / sqrt(2**p)` (1.6% for the default `p=12`, 4 KB).
+    Sketches with the same precision can be merged, also when they were
+    built in different processes.
+
+    Example:
+        >>> sketch = HyperLogLog()
+        >>> sketch.update("a rose is a rose is a rose".split())
+        >>> len(sketch)
+        3
+    """
+
+    def __init__(self, precision=12):
+        """
+        Args:
+            precision (int): number of bits used to pick a register (4-16)
+        """
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+
+        self.precision = precision
+        self.registers = bytearray(2**precision)
+
+    def update(self, tokens):
+        """Add tokens (strings) to the sketch."""
+
+        p = self.precision
+        n_bits = 64 - p
+        registers = self.registers
+
+        for token in set(tokens):
+            # Python's own hash() differs between processes, blake2b does not
+            h = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+            index = h >> n_bits
+            rank = n_bits - (h & ((1 << n_bits) - 1)).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def merge(self, other):
+        """Add the tokens counted by another sketch to this one.
+
+        Returns:
+            HyperLogLog: the object itself
+        """
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches with a different precision")
+
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        """Return the estimated number of unique tokens (a float)."""
+
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small sets
+
+        return estimate
+
+    def __len__(self):
+        return int(round(self.estimate()))
+
+
+class WordStatistics:
+    """Word counts that can be built piece by piece and merged.
+
+    The statistics of a text are the same whether they are computed on the
+    whole text at once or on consecutive pieces of it that are merged
+    afterwards, as long as the pieces do not split words. Merging is
+    associative, so pieces can be processed in separate processes and
+    combined in any grouping (map-reduce style).
+
+    By default every word is counted exactly, so memory grows with the
+    vocabulary. With `mfw_capacity` the word counts are kept in a
+    fixed-size `MisraGries` summary instead and `MFW` is approximate. With
+    `unique_precision` the unique words are counted with a `HyperLogLog`
+    sketch and `n_unique` and `TTR` are approximate. With `mfw_capacity`
+    alone the unique words are still kept in a set for the exact
+    `n_unique`, so memory keeps growing with the vocabulary: use both to
+    keep the memory use fixed.
+
+    Example:
+        >>> stats = WordStatistics("the cat and the hat")
+        >>> stats.merge(WordStatistics("the end")).n_words
+        7
+        >>> (stats + WordStatistics("the end")).MFW(1)
+        ['the']
+    """
+
+    def __init__(self, text=None, mfw_capacity=None, unique_precision=None):
+        """
+        Args:
+            text (str, optional): first piece of text to count
+            mfw_capacity (int, optional): count words approximately with
+                a `MisraGries` summary of this capacity
+            unique_precision (int, optional): count unique words
+                approximately with a `HyperLogLog` sketch of this precision
+        """
+        self.mfw_capacity = mfw_capacity
+        self.unique_precision = unique_precision
+        self.n_words = 0
+
+        if mfw_capacity is None:
+            self.counts = Counter()
+        else:
+            self.counts = MisraGries(mfw_capacity)
+
+        if unique_precision is not None:
+            self.types = HyperLogLog(unique_precision)
+        elif mfw_capacity is not None:
+            self.types = set()
+        else:
+            self.types = None  # the exact counts already give the unique words
+
+        if text is not None:
+            self.update(text)
+
+    @property
+    def exact(self):
+        return self.mfw_capacity is None
+
+    def update(self, text):
+        """Add the words of a piece of text.
+
+        Args:
+            text (str): text to count (words are `text.split()`)
+
+        Returns:
+            WordStatistics: the object itself
+        """
+        counts = Counter(text.split())
+        self.n_words += sum(counts.values())
+        self.counts.update(counts)
+
+        if self.types is not None:
+            self.types.update(counts)
+
+        return self
+
+    def merge(self, other):
+        """Add the counts of another `WordStatistics` object to this one.
+
+        Both objects have to use the same `mfw_capacity` and
+        `unique_precision`.
+
+        Args:
+            other (WordStatistics): statistics to add
+
+        Returns:
+            WordStatistics: the object itself
+        """
+        if (other.mfw_capacity, other.unique_precision) != (self.mfw_capacity, self.unique_precision):
+            raise ValueError("Cannot merge statistics with different settings")
+
+        if self.exact:
+            self.counts.update(other.counts)
+        else:
+            self.counts.merge(other.counts)
+
+        if isinstance(self.types, set):
+            self.types.update(other.types)
+        elif self.types is not None:
+            self.types.merge(other.types)
+
+        self.n_words += other.n_words
+        return self
+
+    def __add__(self, other):
+        empty = WordStatistics(mfw_capacity=self.mfw_capacity, unique_precision=self.unique_precision)
+        return empty.merge(self).merge(other)
+
+    @property
+    def n_unique(self):
+        return len(self.counts) if self.types is None else len(self.types)
+
+    @property
+    def TTR(self):
+        return self.n_unique / self.n_words if self.n_words else 0.0
+
+    def MFW(self, n=10):
+        """Return the `n` most frequent words, most frequent first."""
+        return [word for word, _ in self.counts.most_common(n)]
+
+    def to_dict(self, n_mfw=10):
+        """Return the statistics in the format of `file_statistics`."""
+        return {
+            'n_words': self.n_words,
+            'n_unique': self.n_unique,
+            'TTR': self.TTR,
+            'MFW': self.MFW(n_mfw),
+        }
+
+
+def file_statistics(text, n_mfw=10, mfw_capacity=None, unique_precision=None):
+    """Compute word statistics for a text.
+
+    Words are the whitespace-separated tokens of the text (`text.split()`).
+
+    Args:
+        text (str): text to analyse
+        n_mfw (int): number of most frequent words to return
+        mfw_capacity (int, optional): find the most frequent words
+            approximately, see `WordStatistics` (memory use is only fixed
+            together with `unique_precision`)
+        unique_precision (int, optional): estimate the number of unique
+            words, see `WordStatistics`
+
+    Returns:
+        dict: number of words (`n_words`), number of unique words
+            (`n_unique`), type:token ratio (`TTR`) and the most frequent
+            words (`MFW`)
+    """
+    statistics = WordStatistics(text, mfw_capacity=mfw_capacity, unique_precision=unique_precision)
+    return statistics.to_dict(n_mfw)
+
+
+def _shard_statistics(file_paths, chunk_size, options):
+    """Count the words in a list of files, reading them in chunks."""
+
+    statistics = WordStatistics(**options)
+
+    for file_path in file_paths:
+        for chunk in read_chunks(file_path, chunk_size):
+            statistics.update(chunk)
+
+    return statistics
+
+
+def corpus_word_statistics(source_folder, n_workers=None, chunk_size=2**20, mfw_capacity=None,
+                           unique_precision=None):
+    """Compute the statistics of all files in a folder taken together.
+
+    The files are divided into shards that are counted in separate
+    processes; the resulting `WordStatistics` are merged into one. The
+    corpus is never loaded or tokenized as a single text.
+
+    Args:
+        source_folder (str): folder with the text files
+        n_workers (int, optional): number of processes, defaults to the
+            number of CPUs
+        chunk_size (int): number of characters read at a time, see
+            `example_module.read_chunks`
+        mfw_capacity (int, optional): count words approximately, see
+            `WordStatistics`
+        unique_precision (int, optional): count unique words
+            approximately, see `WordStatistics`
+
+    Returns:
+        WordStatistics: statistics for the whole corpus
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    file_paths = list(list_files(source_folder))
+    n_shards = min(len(file_paths), n_workers * 4)
+    shards = [file_paths[i::n_shards] for i in range(n_shards)]
+
+    options = {'mfw_capacity': mfw_capacity, 'unique_precision': unique_precision}
+
+    if n_workers == 1:
+        partials = [_shard_statistics(shard, chunk_size, options) for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            partials = list(pool.map(_shard_statistics, shards,
+                                     [chunk_size] * n_shards, [options] * n_shards))
+
+    return reduce(WordStatistics.merge, partials, WordStatistics(**options))
+
+
+def file_hash(file_path, block_size=2**20):
+    """Compute the SHA-1 hash of a file's contents.
+
+    Args:
+        file_path (str): path to the file
+        block_size (int): number of bytes read at a time
+
+    Returns:
+        str: hexadecimal hash
+    """
+    sha1 = hashlib.sha1()
+
+    with open(file_path, 'rb') as infile:
+        for block in iter(lambda: infile.read(block_size), b''):
+            sha1.update(block)
+
+    return sha1.hexdigest()
+
+
+def corpus_statistics(source_folder, target_file_path, cache_file_path=None, n_mfw=10,
+                      mfw_capacity=None, unique_precision=None, chunk_size=2**20):
+    """Compute `file_statistics` for every file in a folder and save them as JSON.
+
+    Only new and changed files are analysed. For every file the
+    modification time, size, hash and statistics are kept in a cache file.
+    A file whose modification time and size did not change is not opened
+    at all; a file that was touched but not changed (same hash) is not
+    analysed again. The target file is only rewritten when something
+    changed.
+
+    Args:
+        source_folder (str): folder with the text files
+        target_file_path (str): JSON file to write the statistics to, with
+            the relative file path as key and the statistics as value
+        cache_file_path (str, optional): JSON file with the cache, defaults
+            to `target_file_path` with `.cache` before the extension
+        n_mfw (int): number of most frequent words, see `file_statistics`
+        mfw_capacity (int, optional): find the most frequent words
+            approximately, see `file_statistics`
+        unique_precision (int, optional): estimate the number of unique
+            words, see `file_statistics`
+        chunk_size (int): with `mfw_capacity` or `unique_precision`,
+            files are read this many characters at a time instead of at
+            once, see `example_module.read_chunks`
+
+    Returns:
+        dict: relative file path (key) and statistics (value)
+    """
+    if cache_file_path is None:
+        cache_file_path = '.cache'.join(os.path.splitext(target_file_path))
+
+    settings = {'n_mfw': n_mfw, 'mfw_capacity': mfw_capacity, 'unique_precision': unique_precision}
+    options = {'mfw_capacity': mfw_capacity, 'unique_precision': unique_precision}
+    cache = {'settings': settings, 'files': dict()}
+
+    if os.path.exists(cache_file_path):
+        with open(cache_file_path, encoding='utf-8') as infile:
+            cache = json.load(infile)
+
+    if cache['settings'] != settings:  # cached statistics are computed differently
+        cache = {'settings': settings, 'files': dict()}
+
+    old_entries = cache['files']
+    new_entries = dict()
+    changed = not os.path.exists(target_file_path)
+
+    for file_path in list_files(source_folder):
+        key = os.path.relpath(file_path, source_folder)
+        stat = os.stat(file_path)
+        entry = old_entries.get(key)
+
+        if entry is not None and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            new_entries[key] = entry
+            continue
+
+        sha1 = file_hash(file_path)
+
+        if entry is None or entry['sha1'] != sha1:
+            if mfw_capacity is None and unique_precision is None:
+                with open(file_path, encoding='utf-8') as infile:
+                    statistics = file_statistics(infile.read(), n_mfw=n_mfw)
+            else:
+                # Read in chunks, so that large files are never in memory as a whole
+                statistics = _shard_statistics([file_path], chunk_size, options).to_dict(n_mfw)
+            changed = True
+        else:
+            statistics = entry['statistics']
+
+        new_entries[key] = {
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha1': sha1,
+            'statistics': statistics,
+        }
+
+    changed = changed or new_entries.keys() != old_entries.keys()
+    results = {key: entry['statistics'] for key, entry in new_entries.items()}
+
+    if new_entries != old_entries:
+        cache['files'] = new_entries
+        with open(cache_file_path, 'w', encoding='utf-8') as outfile:
+            json.dump(cache, outfile)
+
+    if changed:
+        with open(target_file_path, 'w', encoding='utf-8') as outfile:
+            json.dump(results, outfile, indent=4)
+
+    return results
+
+
+if __name__ == "__main__":
+
+    statistics = corpus_statistics('data/gutenberg-extension', 'stuff/gutenberg_statistics.json')
+    print(f"Statistics for {len(statistics)} files")
+
+    corpus = corpus_word_statistics('data/gutenberg-extension')
+    print(f"Corpus: {corpus.n_words} words, TTR {corpus.TTR:.3f}, MFW {corpus.MFW(5)}")
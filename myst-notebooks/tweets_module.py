@@ -0,0 +1,1675 @@
+import array
+import gc
+import itertools
+import json
+import os
+import re
+import sqlite3
+import string
+from collections import Counter, deque
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import nltk
+import numpy as np
+import pandas as pd
+from nltk.tokenize import TweetTokenizer, casual
+
+tokenizer = TweetTokenizer(preserve_case=True, reduce_len=False, strip_handles=False)
+
+# `fast_tokenize` uses internals of `nltk.tokenize.casual`. It gives the same
+# tokens as `TweetTokenizer` for these NLTK versions (checked on all tweets
+# in data/elonmusk_tweets.csv); with other versions it falls back to
+# `TweetTokenizer.tokenize`.
+CHECKED_NLTK_VERSIONS = ((3, 6, 7), (3, 10, 3))
+FAST_TOKENIZE = (CHECKED_NLTK_VERSIONS[0]
+                 <= tuple(int(part) for part in re.findall(r'\d+', nltk.__version__)[:3])
+                 <= CHECKED_NLTK_VERSIONS[1]
+                 and all(hasattr(casual, name) for name in ('_replace_html_entities', 'HANG_RE', 'remove_handles',
+                                                            'reduce_lengthening', 'EMOTICON_RE'))
+                 and all(hasattr(TweetTokenizer, name) for name in ('WORD_RE', 'PHONE_WORD_RE')))
+
+# `token in string.punctuation` is a substring test, so it is also True for
+# tokens like '()' or '<=>'. Precomputing all substrings keeps that
+# behaviour while replacing the scan of the string by a set lookup.
+PUNCTUATION = {string.punctuation[i:j]
+               for i in range(len(string.punctuation) + 1)
+               for j in range(i, len(string.punctuation) + 1)}
+
+URL_PREFIXES = ('http', 'www')
+
+# Whitespace other than single spaces can end up in tokens (e.g. in '.  .')
+# or change how the text around it is tokenized (e.g. phone numbers do not
+# continue over a newline), so then the original whitespace is kept
+WHITESPACE_RE = re.compile(r'(\s+)')
+OTHER_WHITESPACE_RE = re.compile(r'[^\S ]|  ')
+
+# Zero-width joiners and skin tone modifiers can glue a token to the
+# whitespace before it, so tweets containing them always use the full regex
+JOINER_RE = re.compile('[\u200d\U0001f3fb-\U0001f3ff]')
+
+# Cheap test for runs that `casual.HANG_RE` may shorten
+REPEAT_RE = re.compile(r'(.)\1{3}', re.DOTALL)
+
+# A whitespace-separated chunk that is a word (letters, possibly joined by
+# apostrophes, hyphens or underscores), optionally followed by one of these
+# characters, is tokenized the same by the `TweetTokenizer` regex as by
+# simply splitting off that character. Such chunks can skip the regex.
+SIMPLE_ENDINGS = frozenset(',!?.')
+WORD_JOINERS = str.maketrans('', '', "'-_")
+WORD_RE = re.compile(r"[^\W\d_]+(?:['\-_][^\W\d_]+)*")
+
+
+def filter_tweet(tokens):
+    """
+    Normalize a tweet's text by removing punctuation tokens and URls.
+
+    Args:
+        tokens (list): List of tokens from a tokenizer
+
+    Returns:
+        list: List of non-punctuation and URL tokens
+    """
+    return [token for token in tokens
+            if len(token) > 3 and token not in PUNCTUATION and not token.startswith(URL_PREFIXES)]
+
+
+def _is_word(word):
+    """Check if a chunk is a word that the `TweetTokenizer` regex keeps whole."""
+
+    # isalpha() is stricter than the regex' notion of letters, so only
+    # words that pass both are safe
+    return word.isalpha() or (WORD_RE.fullmatch(word) is not None
+                              and word.translate(WORD_JOINERS).isalpha())
+
+
+def fast_tokenize(tweet, tokenizer=tokenizer):
+    """Tokenize a tweet exactly like `tokenizer.tokenize`, but faster.
+
+    Most of a tweet consists of plain words, which are split off directly;
+    only the remaining parts (URLs, handles, numbers, emoticons, ...) go
+    through the `TweetTokenizer` regular expression.
+
+    This uses internals of `nltk.tokenize.casual`, so with NLTK versions
+    outside `CHECKED_NLTK_VERSIONS` it simply calls `tokenizer.tokenize`.
+    After checking a new version (e.g. with `python benchmarks.py
+    tokenize_tweets`), extend the range.
+
+    Example:
+        >>> tweets = ["@elonmusk Model-3 :-) http://t.co/x 555-123-4567 &amp; soooo cool!!",
+        ...           "Wow . . . so  coooool\\nright ,#AI? 👍🏽 ok", "naïve co-op café… 'quoted' 3.14"]
+        >>> lowercase = TweetTokenizer(preserve_case=False, reduce_len=True, strip_handles=True)
+        >>> all(fast_tokenize(tweet, tk) == tk.tokenize(tweet) for tweet in tweets for tk in (tokenizer, lowercase))
+        True
+
+    Args:
+        tweet (str): text of the tweet
+        tokenizer (TweetTokenizer): tokenizer whose settings are used
+
+    Returns:
+        list: List of tokens
+    """
+    if not FAST_TOKENIZE:
+        return tokenizer.tokenize(tweet)
+
+    text = casual._replace_html_entities(tweet) if '&' in tweet else tweet
+    if tokenizer.strip_handles:
+        text = casual.remove_handles(text)
+    if tokenizer.reduce_len:
+        text = casual.reduce_lengthening(text)
+    if REPEAT_RE.search(text):
+        text = casual.HANG_RE.sub(r"\1\1\1", text)
+
+    if getattr(tokenizer, 'match_phone_numbers', True):
+        word_re = tokenizer.PHONE_WORD_RE
+    else:
+        word_re = tokenizer.WORD_RE
+
+    if JOINER_RE.search(text):
+        tokens = word_re.findall(text)
+    else:
+        tokens = []
+
+        if OTHER_WHITESPACE_RE.search(text):
+            parts = WHITESPACE_RE.split(text)
+            chunks, separators = parts[0::2], parts[1::2] + ['']
+        else:
+            chunks = text.split()
+            separators = None
+
+        pending = []  # consecutive chunks that need the regex, with their whitespace
+        last = len(chunks) - 1
+
+        for i, chunk in enumerate(chunks):
+            if not chunk:
+                continue
+
+            word, ending = chunk, None
+            if chunk[-1] in SIMPLE_ENDINGS:
+                word, ending = chunk[:-1], chunk[-1]
+
+            # '.' followed by ' .' would be an ellipsis
+            if _is_word(word) and not (ending == '.' and i < last and chunks[i + 1].startswith('.')):
+                if pending:
+                    tokens += word_re.findall(''.join(pending))
+                    pending = []
+                tokens.append(word)
+                if ending is not None:
+                    tokens.append(ending)
+            else:
+                pending.append(chunk)
+                pending.append(' ' if separators is None else separators[i])
+
+        if pending:
+            tokens += word_re.findall(''.join(pending))
+
+    if not tokenizer.preserve_case:
+        tokens = [token if casual.EMOTICON_RE.search(token) else token.lower() for token in tokens]
+
+    return tokens
+
+
+def tokenize_tweet(tweet, tokenizer=tokenizer):
+    """Tokenize and filter a tweet, and join the tokens back into a string.
+
+    Args:
+        tweet (str): text of the tweet
+        tokenizer (TweetTokenizer): tokenizer to use
+
+    Returns:
+        str: normalized tweet
+    """
+    return " ".join(filter_tweet(fast_tokenize(tweet, tokenizer)))
+
+
+def _tokenize_batch(tweets, tokenizer, return_tokens):
+    """Tokenize a list of tweets (used by the worker processes)."""
+
+    if return_tokens:
+        return [filter_tweet(fast_tokenize(tweet, tokenizer)) for tweet in tweets]
+    return [" ".join(filter_tweet(fast_tokenize(tweet, tokenizer))) for tweet in tweets]
+
+
+def tokenize_tweets(tweets, tokenizer=tokenizer, return_tokens=False, n_workers=1, batch_size=10000):
+    """Tokenize and filter many tweets at once.
+
+    This gives the same result as `tweets.apply(tokenize_tweet)`, but uses
+    `fast_tokenize` and can spread the work over several processes. On one
+    core it is about 2.5 times as fast as `apply` (see `python benchmarks.py
+    tokenize_tweets`); more speed has to come from `n_workers`.
+
+    Args:
+        tweets (pd.Series or list): texts of the tweets
+        tokenizer (TweetTokenizer): tokenizer to use
+        return_tokens (bool): if True, return lists of tokens instead of
+            normalized strings
+        n_workers (int): number of processes to use
+        batch_size (int): number of tweets sent to a process at a time
+
+    Returns:
+        pd.Series or list: normalized tweets (or lists of tokens), as a
+            Series with the same index if `tweets` is a Series
+    """
+    texts = list(tweets)
+
+    if n_workers == 1:
+        results = _tokenize_batch(texts, tokenizer, return_tokens)
+    else:
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        results = []
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            for batch in pool.map(_tokenize_batch, batches,
+                                  [tokenizer] * len(batches), [return_tokens] * len(batches)):
+                results += batch
+
+    if isinstance(tweets, pd.Series):
+        return pd.Series(results, index=tweets.index, name=tweets.name)
+    return results
+
+
+def tokenizer_config(tokenizer):
+    """Describe the settings of a tokenizer as a string, for use as cache key.
+
+    Args:
+        tokenizer (TweetTokenizer): tokenizer
+
+    Returns:
+        str: e.g. 'preserve_case=True,reduce_len=False,...'
+    """
+    settings = ('preserve_case', 'reduce_len', 'strip_handles', 'match_phone_numbers')
+    return ','.join(f'{name}={getattr(tokenizer, name, None)}' for name in settings)
+
+
+class TokenCache:
+    """On-disk cache of filtered tweet tokens, keyed by tweet id.
+
+    The text of a tweet never changes for a given id, so its tokens only
+    have to be computed once per tokenizer configuration. The cache is a
+    SQLite database that keeps at most `max_entries` tweets; when it grows
+    larger, the least recently used tweets are removed.
+
+    Example:
+        with TokenCache('stuff/tokens.sqlite') as cache:
+            df_elon['clean_text'] = tokenize_tweets_cached(df_elon['text'], df_elon['id'], cache)
+    """
+
+    def __init__(self, path, max_entries=1000000):
+        """
+        Args:
+            path (str): path to the database file (created if needed)
+            max_entries (int): maximum number of cached tweets
+        """
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS tokens '
+            '(config TEXT, id INTEGER, tokens TEXT, last_used INTEGER, PRIMARY KEY (config, id))')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens (last_used)')
+        self._clock = self.connection.execute('SELECT MAX(last_used) FROM tokens').fetchone()[0] or 0
+
+    def get_many(self, config, ids, batch_size=500):
+        """Look up the tokens of several tweets.
+
+        Args:
+            config (str): tokenizer configuration, see `tokenizer_config`
+            ids (list): tweet ids
+
+        Returns:
+            dict: tweet id (key) and list of tokens (value) for the tweets
+                that are in the cache
+        """
+        self._clock += 1
+        found = dict()
+        ids = [int(tweet_id) for tweet_id in ids]
+
+        with self.connection:
+            for i in range(0, len(ids), batch_size):
+                batch = ids[i:i + batch_size]
+                placeholders = ','.join('?' * len(batch))
+                rows = self.connection.execute(
+                    f'SELECT id, tokens FROM tokens WHERE config = ? AND id IN ({placeholders})',
+                    [config] + batch)
+                hits = [(tweet_id, json.loads(tokens)) for tweet_id, tokens in rows]
+                found.update(hits)
+
+                if hits:
+                    self.connection.execute(
+                        f'UPDATE tokens SET last_used = ? WHERE config = ? AND id IN '
+                        f'({",".join("?" * len(hits))})',
+                        [self._clock, config] + [tweet_id for tweet_id, _ in hits])
+
+        return found
+
+    def put_many(self, config, items):
+        """Store the tokens of several tweets.
+
+        Args:
+            config (str): tokenizer configuration, see `tokenizer_config`
+            items (dict): tweet id (key) and list of tokens (value)
+        """
+        self._clock += 1
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?)',
+                ((config, int(tweet_id), json.dumps(tokens), self._clock)
+                 for tweet_id, tokens in items.items()))
+            self._evict()
+
+    def _evict(self):
+        n_entries = self.connection.execute('SELECT COUNT(*) FROM tokens').fetchone()[0]
+
+        if n_entries > self.max_entries:
+            self.connection.execute(
+                'DELETE FROM tokens WHERE rowid IN '
+                '(SELECT rowid FROM tokens ORDER BY last_used LIMIT ?)',
+                (n_entries - self.max_entries,))
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM tokens').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def tokenize_tweets_cached(tweets, ids, cache, tokenizer=tokenizer, return_tokens=False, **kwargs):
+    """Like `tokenize_tweets`, but only tokenize tweets that are not in the cache.
+
+    Args:
+        tweets (pd.Series or list): texts of the tweets
+        ids (pd.Series or list): ids of the tweets, in the same order
+        cache (TokenCache): cache to read from and add the new tweets to
+        tokenizer (TweetTokenizer): tokenizer to use
+        return_tokens (bool): if True, return lists of tokens instead of
+            normalized strings
+        **kwargs: passed on to `tokenize_tweets` for the new tweets
+
+    Returns:
+        pd.Series or list: normalized tweets (or lists of tokens), as a
+            Series with the same index if `tweets` is a Series
+    """
+    config = tokenizer_config(tokenizer)
+    texts = list(tweets)
+    ids = [int(tweet_id) for tweet_id in ids]
+
+    known = cache.get_many(config, ids)
+    missing = [i for i, tweet_id in enumerate(ids) if tweet_id not in known]
+
+    if missing:
+        new_tokens = tokenize_tweets([texts[i] for i in missing], tokenizer=tokenizer,
+                                     return_tokens=True, **kwargs)
+        new = {ids[i]: tokens for i, tokens in zip(missing, new_tokens)}
+        cache.put_many(config, new)
+        known.update(new)
+
+    results = [known[tweet_id] for tweet_id in ids]
+    if not return_tokens:
+        results = [" ".join(tokens) for tokens in results]
+
+    if isinstance(tweets, pd.Series):
+        return pd.Series(results, index=tweets.index, name=tweets.name)
+    return results
+
+
+class VocabularyCounter(Mapping):
+    """Count tokens with an integer vocabulary instead of a list of strings.
+
+    Every distinct token gets an integer id and is counted in a NumPy
+    array. Texts are processed in batches, so memory grows with the size of
+    the vocabulary and not with the size of the corpus. The object behaves
+    like a read-only `Counter`: missing tokens count 0, and `most_common()`
+    works as usual.
+
+    Example:
+        >>> counter = VocabularyCounter(["robots spared humanity", "robots rule"])
+        >>> counter["robots"], counter["humans"]
+        (2, 0)
+        >>> counter.most_common(2)  # ties in the order they were first seen
+        [('robots', 2), ('spared', 1)]
+    """
+
+    def __init__(self, texts=None, batch_size=2**20):
+        """
+        Args:
+            texts (iterable, optional): texts to count, see `update`
+            batch_size (int): number of characters of text counted at a time
+        """
+        self.vocabulary = dict()
+        self.tokens = []  # id -> token
+        self.batch_size = batch_size
+        self._counts = np.zeros(1024, dtype=np.int64)
+
+        if texts is not None:
+            self.update(texts)
+
+    @property
+    def counts(self):
+        """NumPy array with the count of every token id."""
+        return self._counts[:len(self.tokens)]
+
+    def update(self, texts):
+        """Count the whitespace-separated tokens of some texts.
+
+        Args:
+            texts (iterable): e.g. the `clean_text` column of the tweets
+
+        Returns:
+            VocabularyCounter: the object itself
+        """
+        batch = []
+        n_characters = 0
+
+        for text in texts:
+            batch.append(text)
+            n_characters += len(text)
+
+            if n_characters >= self.batch_size:
+                self._add(batch)
+                batch = []
+                n_characters = 0
+
+        self._add(batch)
+        return self
+
+    def _add(self, texts):
+        batch_counts = Counter(" ".join(texts).split())
+
+        for token in batch_counts:
+            if token not in self.vocabulary:
+                self.vocabulary[token] = len(self.tokens)
+                self.tokens.append(token)
+
+        if len(self.tokens) > len(self._counts):
+            capacity = max(len(self.tokens), 2 * len(self._counts))
+            self._counts = np.concatenate(
+                [self._counts, np.zeros(capacity - len(self._counts), dtype=np.int64)])
+
+        n = len(batch_counts)
+        ids = np.fromiter(map(self.vocabulary.__getitem__, batch_counts), dtype=np.int64, count=n)
+        self._counts[ids] += np.fromiter(batch_counts.values(), dtype=np.int64, count=n)
+
+    def __getitem__(self, token):
+        token_id = self.vocabulary.get(token)
+        return 0 if token_id is None else int(self._counts[token_id])
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, token):
+        return token in self.vocabulary
+
+    def total(self):
+        """Return the number of counted tokens."""
+        return int(self.counts.sum())
+
+    def most_common(self, n=None):
+        """Return the `n` most common tokens and their counts, like `Counter.most_common`."""
+
+        counts = self.counts
+
+        if n is None or n >= len(counts):
+            order = np.argsort(-counts, kind='stable')
+        elif n <= 0:
+            order = []
+        else:
+            # All ids tied with the n-th count are kept, so that the stable sort
+            # below can pick them in first-seen order, like Counter
+            kth = counts[np.argpartition(-counts, n - 1)[n - 1]]
+            top = np.flatnonzero(counts >= kth)
+            order = top[np.argsort(-counts[top], kind='stable')][:n]
+
+        return [(self.tokens[i], int(counts[i])) for i in order]
+
+    def to_counter(self):
+        """Return the counts as a regular `Counter`."""
+        return Counter(dict(zip(self.tokens, self.counts.tolist())))
+
+
+class TweetIndex:
+    """Inverted index over tokenized tweets, for fast term and phrase counts.
+
+    For every token the index stores in which tweets, and at which
+    positions, it occurs. Counting a term or a phrase is then a lookup
+    instead of a scan over all tweets. Note that terms are matched as whole
+    tokens: unlike `.str.count('Tesla')`, 'Teslas' is not counted for
+    'Tesla'.
+
+    Example:
+        >>> index = TweetIndex(["Tesla Model next", "SpaceX and Tesla Model"])
+        >>> index.count("Tesla"), index.count("Tesla Model"), index.count("Model Tesla")
+        (2, 2, 0)
+        >>> TweetIndex(["x Tesla", "Model"]).count("Tesla Model")  # phrases stay within a tweet
+        0
+        >>> index.term_counts(["Tesla", "SpaceX"], by=[2016, 2017])
+              Tesla  SpaceX
+        2016      1       0
+        2017      1       1
+        >>> index.term_counts(["Tesla"], by=[2016, np.nan])  # tweets without a group are left out
+                Tesla
+        2016.0      1
+    """
+
+    def __init__(self, texts):
+        """
+        Args:
+            texts (pd.Series or list): tweets as whitespace-separated
+                tokens, e.g. the `clean_text` column
+        """
+        self.index = texts.index if isinstance(texts, pd.Series) else pd.RangeIndex(len(texts))
+        self.vocabulary = dict()
+
+        token_ids = array.array('q')
+        tweet_numbers = array.array('q')
+        positions = array.array('q')
+
+        for tweet_number, text in enumerate(texts):
+            tokens = text.split()
+            token_ids.extend([self.vocabulary.setdefault(token, len(self.vocabulary))
+                              for token in tokens])
+            tweet_numbers.extend([tweet_number] * len(tokens))
+            positions.extend(range(len(tokens)))
+
+        token_ids = np.frombuffer(token_ids, dtype=np.int64)
+        order = np.argsort(token_ids, kind='stable')
+
+        # Postings of token i are tweets[offsets[i]:offsets[i + 1]] (and positions)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(token_ids, minlength=len(self.vocabulary)))])
+        self.tweets = np.frombuffer(tweet_numbers, dtype=np.int64)[order]
+        self.positions = np.frombuffer(positions, dtype=np.int64)[order]
+        self.n_tweets = len(self.index)
+
+    def postings(self, token):
+        """Return the tweet numbers and positions where a token occurs.
+
+        Args:
+            token (str): a single token
+
+        Returns:
+            tuple: two NumPy arrays, tweet numbers (0 for the first tweet)
+                and positions within the tweet
+        """
+        token_id = self.vocabulary.get(token)
+        if token_id is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        start, end = self.offsets[token_id], self.offsets[token_id + 1]
+        return self.tweets[start:end], self.positions[start:end]
+
+    def _matches(self, term):
+        """Return the tweet number of every occurrence of a term or phrase."""
+
+        words = term.split()
+        if not words:
+            raise ValueError("Terms cannot be empty")
+
+        tweets, positions = self.postings(words[0])
+
+        if len(words) > 1:
+            stride = int(self.positions.max()) + 1 if len(self.positions) else 1
+            starts = tweets * stride + positions
+
+            for offset, word in enumerate(words[1:], start=1):
+                next_tweets, next_positions = self.postings(word)
+                # Occurrences of the next word, shifted back to where the phrase
+                # starts; those too early in their tweet cannot continue a phrase
+                # (shifting them would land in the previous tweet)
+                in_phrase = next_positions >= offset
+                shifted = next_tweets[in_phrase] * stride + next_positions[in_phrase] - offset
+                starts = starts[np.isin(starts, shifted)]
+
+            tweets = starts // stride
+
+        return tweets
+
+    def count(self, term):
+        """Count the occurrences of a term, or of a phrase of several terms.
+
+        Args:
+            term (str): token, or tokens separated by spaces for a phrase
+
+        Returns:
+            int: number of occurrences in all tweets
+        """
+        return len(self._matches(term))
+
+    def counts_per_tweet(self, term):
+        """Count the occurrences of a term or phrase in every tweet.
+
+        Returns:
+            pd.Series: count per tweet, with the index of the texts
+        """
+        counts = np.bincount(self._matches(term), minlength=self.n_tweets)
+        return pd.Series(counts, index=self.index, name=term)
+
+    def term_counts(self, terms, by=None):
+        """Count several terms or phrases at once, optionally per group.
+
+        Args:
+            terms (list): terms or phrases to count
+            by (pd.Series or list, optional): group of every tweet (e.g. the
+                `year` column), in the same order as the texts; tweets
+                whose group is missing are not counted, like in `groupby`
+
+        Returns:
+            pd.DataFrame: one column per term, with one row per tweet or,
+                if `by` is given, one row per group
+        """
+        if by is None:
+            codes, groups = np.arange(self.n_tweets), self.index
+        else:
+            codes, groups = pd.factorize(np.asarray(by), sort=True)
+
+        n_groups = len(groups)
+        columns = dict()
+
+        for term in terms:
+            matched = codes[self._matches(term)]
+            columns[term] = np.bincount(matched[matched >= 0], minlength=n_groups)
+
+        return pd.DataFrame(columns, index=groups)
+
+
+class KeywordCounter:
+    """Count many keywords in one pass over each text (Aho-Corasick).
+
+    The keywords are compiled once into an automaton that reads each text
+    character by character and reports every keyword that ends at that
+    character. By default the counts are the same as `text.count(keyword)`
+    for every keyword (non-overlapping occurrences, also inside words).
+
+    Reading a text in Python is slower than a `str.count` in C, so the
+    automaton only pays off for many keywords: on the tweets the break-even
+    point is around 60 to 100 keywords. Below `AUTOMATON_MIN_KEYWORDS`
+    every keyword is counted separately with `str.count` (or a regular
+    expression for `whole_words`), with the same results.
+
+    Example:
+        >>> counter = KeywordCounter(["Tesla", "SpaceX", "Model"])
+        >>> counter.count("Tesla Model S and Tesla Model X by Teslas")
+        [3, 0, 2]
+        >>> KeywordCounter(["tesla"], case_sensitive=False, whole_words=True).count("Tesla Teslas")
+        [1]
+    """
+
+    # Fewer keywords are counted one by one, see the class docstring
+    AUTOMATON_MIN_KEYWORDS = 64
+
+    def __init__(self, keywords, case_sensitive=True, whole_words=False):
+        """
+        Args:
+            keywords (list): keywords to count (non-empty strings)
+            case_sensitive (bool): if False, ignore upper/lower case
+            whole_words (bool): if True, only count keywords that are not
+                directly preceded or followed by a letter, digit or '_'
+        """
+        self.keywords = list(keywords)
+        self.case_sensitive = case_sensitive
+        self.whole_words = whole_words
+
+        if not all(self.keywords):
+            raise ValueError("Keywords cannot be empty")
+
+        if len(self.keywords) < self.AUTOMATON_MIN_KEYWORDS:
+            # `\w` is a letter, digit or '_', like in `_is_boundary`
+            self.patterns = [(keyword, re.compile(r'(?<!\w)' + re.escape(keyword) + r'(?!\w)')
+                              if whole_words else None)
+                             for keyword in map(self._normalize, self.keywords)]
+            return
+
+        self.patterns = None
+
+        # Trie: goto[state] maps a character to the next state
+        self.goto = [dict()]
+        outputs = [[]]
+
+        for number, keyword in enumerate(self.keywords):
+            state = 0
+            for character in self._normalize(keyword):
+                if character not in self.goto[state]:
+                    self.goto[state][character] = len(self.goto)
+                    self.goto.append(dict())
+                    outputs.append([])
+                state = self.goto[state][character]
+            outputs[state].append(number)
+
+        # Failure links: the longest proper suffix of a state that is also in
+        # the trie. Breadth-first, so the links of shorter states are known.
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for character, next_state in self.goto[state].items():
+                queue.append(next_state)
+
+                fallback = self.fail[state]
+                while fallback and character not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(character, 0)
+                outputs[next_state] = outputs[next_state] + outputs[self.fail[next_state]]
+
+        # Keywords ending in each state, with their lengths (lowercasing can change a length)
+        self.outputs = [[(number, len(self._normalize(self.keywords[number]))) for number in output]
+                        for output in outputs]
+
+    def _normalize(self, text):
+        return text if self.case_sensitive else text.lower()
+
+    def count(self, text):
+        """Count all keywords in a text.
+
+        Args:
+            text (str): text to search
+
+        Returns:
+            list: count of every keyword, in the order of `keywords`
+        """
+        text = self._normalize(text)
+
+        if self.patterns is not None:
+            # The regular expression is only needed when the keyword occurs at all
+            return [(len(pattern.findall(text)) if keyword in text else 0) if pattern is not None
+                    else text.count(keyword)
+                    for keyword, pattern in self.patterns]
+
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+
+        counts = [0] * len(self.keywords)
+        next_allowed = [0] * len(self.keywords)  # to skip overlapping matches
+        state = 0
+
+        for end, character in enumerate(text, start=1):
+            while state and character not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(character, 0)
+
+            for number, length in outputs[state]:
+                start = end - length
+                if start < next_allowed[number]:
+                    continue
+                if self.whole_words and not _is_boundary(text, start, end):
+                    continue
+                counts[number] += 1
+                next_allowed[number] = end
+
+        return counts
+
+    def count_all(self, texts):
+        """Count all keywords in every text of a column.
+
+        Args:
+            texts (pd.Series or list): texts to search
+
+        Returns:
+            pd.DataFrame: one row per text (with the index of `texts`) and
+                one column per keyword
+        """
+        index = texts.index if isinstance(texts, pd.Series) else None
+        rows = [self.count(text) for text in texts]
+        return pd.DataFrame(rows, index=index, columns=self.keywords, dtype=np.int64)
+
+
+def _is_boundary(text, start, end):
+    """Check that text[start:end] is not part of a longer word."""
+
+    def is_word_character(i):
+        return 0 <= i < len(text) and (text[i].isalnum() or text[i] == '_')
+
+    return not is_word_character(start - 1) and not is_word_character(end)
+
+
+class TweetCube:
+    """Tweet and mention counts pre-aggregated per hour.
+
+    Counts are kept per hour (the finest grouping used in the notebooks),
+    so breakdowns by year, month, weekday, hour or a combination of them
+    only have to add up the hourly cells instead of grouping all tweets.
+    New tweets can be added with `append`.
+
+    Time zone aware timestamps are counted in their own local time, like
+    in `calendar_features`. Tweets without a time (NaT) are not counted,
+    like `groupby` leaves out missing keys.
+
+    Example:
+        cube = TweetCube(df['created_at'], df['n_mentions'])
+        cube.rollup('year')                 # like df.groupby('year')
+        cube.rollup(['weekday', 'hour'])    # like df.groupby(['week_day', 'day_hour'])
+
+        >>> times = pd.Series(pd.to_datetime(['2017-01-01 00:30', None])).dt.tz_localize('Europe/Amsterdam')
+        >>> cube = TweetCube(times, [2, 1]).append(pd.Series(['2016-12-31 10:00']), [1])
+        >>> cube.rollup('year').to_dict('index')  # 00:30 in Amsterdam is still 2016 in UTC
+        {2016: {'tweets': 1, 'mentions': 1}, 2017: {'tweets': 1, 'mentions': 2}}
+    """
+
+    LEVELS = ('year', 'month', 'date', 'weekday', 'hour')
+
+    def __init__(self, created_at, n_mentions=None):
+        """
+        Args:
+            created_at (pd.Series): timestamps of the tweets (strings are
+                converted with `pd.to_datetime`)
+            n_mentions (pd.Series, optional): number of mentions per tweet
+        """
+        self.cells = pd.DataFrame({'tweets': pd.Series(dtype=np.int64),
+                                   'mentions': pd.Series(dtype=np.int64)},
+                                  index=pd.DatetimeIndex([], name='hour'))
+        self.append(created_at, n_mentions)
+
+    def append(self, created_at, n_mentions=None):
+        """Add tweets to the cube.
+
+        Args:
+            created_at (pd.Series): timestamps of the new tweets
+            n_mentions (pd.Series, optional): number of mentions per tweet
+
+        Returns:
+            TweetCube: the object itself
+        """
+        times = pd.DatetimeIndex(pd.to_datetime(created_at))
+        if times.tz is not None:
+            times = times.tz_localize(None)  # local time, like `calendar_features`
+        hours = times.floor('h')
+        if n_mentions is None:
+            n_mentions = np.zeros(len(hours), dtype=np.int64)
+
+        new_cells = pd.DataFrame({'tweets': 1, 'mentions': np.asarray(n_mentions, dtype=np.int64)},
+                                 index=hours).groupby(level=0).sum()
+        new_cells.index.name = 'hour'
+
+        self.cells = self.cells.add(new_cells, fill_value=0).astype(np.int64)
+        return self
+
+    def _level(self, level):
+        hours = self.cells.index
+
+        if level == 'year':
+            return hours.year
+        if level == 'month':
+            return hours.to_period('M')
+        if level == 'date':
+            return hours.normalize()
+        if level == 'weekday':
+            return hours.weekday
+        if level == 'hour':
+            return hours.hour
+        raise ValueError(f"Unknown level {level!r}, use one of {self.LEVELS}")
+
+    def rollup(self, by):
+        """Return the counts grouped by one or more time levels.
+
+        Args:
+            by (str or list): 'year', 'month', 'date', 'weekday' (0 is
+                Monday) or 'hour', or a list of these
+
+        Returns:
+            pd.DataFrame: `tweets` and `mentions` per group. Grouped by
+                'month' or 'date' alone, periods without tweets are
+                included with 0, like `pd.Grouper(freq='M')`.
+        """
+        levels = [by] if isinstance(by, str) else list(by)
+        keys = [self._level(level) for level in levels]
+
+        result = self.cells.groupby(keys).sum()
+
+        if levels == ['month'] and len(result):
+            result = result.reindex(pd.period_range(result.index.min(), result.index.max(), freq='M'),
+                                    fill_value=0)
+        elif levels == ['date'] and len(result):
+            result = result.reindex(pd.date_range(result.index.min(), result.index.max(), freq='D'),
+                                    fill_value=0)
+
+        result.index.names = levels
+        return result
+
+
+# Patterns for the entities in tweets; the mention pattern is the one used
+# by `find_mentions` in notebook 4
+ENTITY_PATTERNS = {
+    'mention': re.compile(r'@[a-zA-Z0-9_]{1,15}'),
+    'hashtag': re.compile(r'#\w+'),
+    'url': re.compile(r'https?://\S+'),
+}
+
+# Per-tweet columns with the entities and their number
+ENTITY_COLUMNS = {
+    'mention': ('tweet_mentions', 'n_mentions'),
+    'hashtag': ('hashtags', 'n_hashtags'),
+    'url': ('urls', 'n_urls'),
+}
+
+
+@contextmanager
+def _gc_paused():
+    """Pause the garbage collector while creating millions of small objects.
+
+    None of them can be part of a reference cycle, but the collector is
+    triggered by the number of objects created and would keep scanning them.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def extract_entities(texts, return_columns=False):
+    """Find all mentions, hashtags and URLs in a column of tweets.
+
+    `re.findall` of the compiled patterns is mapped over the texts directly,
+    so the work per tweet is all in C; the counts and the long format table
+    are computed from those lists with NumPy.
+
+    Args:
+        texts (pd.Series or list): texts of the tweets
+        return_columns (bool): if True, also return the per-tweet columns
+            (see below) computed from the same scan
+
+    Returns:
+        pd.DataFrame: long format table with one row per entity, with the
+            index of the tweet it was found in and the columns `kind`
+            ('mention', 'hashtag' or 'url') and `entity`, sorted by tweet
+            and then by kind. If `return_columns` is True, a tuple with
+            that table and a table with one row per tweet and the columns
+            `tweet_mentions`, `n_mentions`, `hashtags`, `n_hashtags`, `urls`
+            and `n_urls` (`tweet_mentions` and `n_mentions` as in notebook 4).
+    """
+    index = texts.index if isinstance(texts, pd.Series) else pd.RangeIndex(len(texts))
+    texts = texts.tolist() if isinstance(texts, pd.Series) else list(texts)
+
+    columns = dict()
+    found, counts = [], []
+    with _gc_paused():
+        for kind, pattern in ENTITY_PATTERNS.items():
+            entity_column, count_column = ENTITY_COLUMNS[kind]
+            found.append(list(map(pattern.findall, texts)))
+            counts.append(np.fromiter(map(len, found[-1]), dtype=np.int64, count=len(texts)))
+            columns[entity_column], columns[count_column] = found[-1], counts[-1]
+
+        rows = np.concatenate([np.repeat(np.arange(len(texts)), count) for count in counts])
+        kinds = np.repeat(np.arange(len(ENTITY_PATTERNS)), [count.sum() for count in counts])
+        entities = np.fromiter(itertools.chain.from_iterable(itertools.chain.from_iterable(found)),
+                               dtype=object, count=len(rows))
+
+        # The kinds are concatenated in order, so a stable sort keeps them grouped
+        order = np.argsort(rows, kind='stable')
+        long_table = pd.DataFrame({
+            'kind': pd.Categorical.from_codes(kinds[order], categories=list(ENTITY_PATTERNS)),
+            'entity': entities[order],
+        }, index=index[rows[order]])
+
+        if not return_columns:
+            return long_table
+
+        return long_table, pd.DataFrame(columns, index=index)
+
+
+class MentionGraph:
+    """Who mentions whom, as a sparse adjacency matrix.
+
+    Every mention in a tweet is an edge from the author of the tweet to the
+    mentioned user. The edges are kept as NumPy arrays sorted by time, and
+    the graph as a CSR (compressed sparse row) matrix: the users mentioned
+    by user i are `indices[indptr[i]:indptr[i + 1]]`, and how often in
+    `data`. Handles are lowercased and without '@', as Twitter handles are
+    not case-sensitive.
+
+    Example:
+        graph = MentionGraph.from_frame(df, author='elonmusk')
+        graph.top_mentioned(5)
+        graph.in_degree(start='2017-01-01', end='2018-01-01')
+    """
+
+    def __init__(self, authors, mentions, created_at=None):
+        """
+        Args:
+            authors (str or pd.Series): author of every tweet, or a single
+                author for all tweets
+            mentions (pd.Series or list): list of mentioned handles for
+                every tweet, like the `tweet_mentions` column
+            created_at (pd.Series, optional): timestamps of the tweets,
+                needed for queries with `start` and `end`
+        """
+        mentions = mentions.tolist() if isinstance(mentions, pd.Series) else list(mentions)
+        n_tweets = len(mentions)
+        counts = np.fromiter(map(len, mentions), dtype=np.int64, count=n_tweets)
+
+        if isinstance(authors, str):
+            authors = [authors]
+            author_rows = np.zeros(n_tweets, dtype=np.int64)
+        else:
+            authors = np.asarray(authors, dtype=object)
+            author_rows = np.arange(n_tweets)
+
+        with _gc_paused():
+            handles = np.fromiter(itertools.chain.from_iterable(mentions), dtype=object, count=counts.sum())
+        # One id per user, for authors and mentioned users alike; handles are
+        # normalized after factorizing, so only once per distinct spelling
+        codes, spellings = pd.factorize(np.concatenate([authors, handles]))
+        user_codes, users = pd.factorize(pd.Index(spellings, dtype=object).str.lstrip('@').str.lower())
+        codes = user_codes[codes]
+        self.users = pd.Index(users, name='user')
+        n_users = len(self.users)
+        dtype = np.int32 if n_users < 2**31 else np.int64
+
+        sources = np.repeat(codes[:len(authors)][author_rows], counts).astype(dtype)
+        targets = codes[len(authors):].astype(dtype)
+
+        if created_at is None:
+            self.times = None
+        else:
+            times = pd.to_datetime(np.asarray(created_at)).values.astype('datetime64[ns]').view(np.int64)
+            times = np.repeat(times, counts)
+            order = np.argsort(times, kind='stable')
+            self.times, sources, targets = times[order], sources[order], targets[order]
+
+        self.sources, self.targets = sources, targets
+        self.indptr, self.indices, self.data = self._csr(sources, targets)
+
+    @classmethod
+    def from_frame(cls, df, author, mentions='tweet_mentions', text='text', created_at='created_at'):
+        """Build the graph from a tweet DataFrame.
+
+        Args:
+            df (pd.DataFrame): the tweets
+            author (str): name of the column with the authors, or the
+                author of all tweets if there is no such column
+            mentions (str): column with the lists of mentions; if the frame
+                does not have it, mentions are found in the `text` column
+            text (str): column with the texts of the tweets
+            created_at (str): column with the timestamps, if present
+
+        Returns:
+            MentionGraph: the graph
+        """
+        authors = df[author] if author in df.columns else author
+        if mentions in df.columns:
+            tweet_mentions = df[mentions]
+        else:
+            tweet_mentions = list(map(ENTITY_PATTERNS['mention'].findall, df[text].tolist()))
+        times = df[created_at] if created_at in df.columns else None
+
+        return cls(authors, tweet_mentions, times)
+
+    @property
+    def n_users(self):
+        return len(self.users)
+
+    @property
+    def n_edges(self):
+        """Number of mentions."""
+        return len(self.sources)
+
+    def _csr(self, sources, targets):
+        """Return indptr, indices and data of the adjacency matrix of some edges."""
+        n_users = self.n_users
+        keys, weights = np.unique(sources.astype(np.int64) * n_users + targets, return_counts=True)
+        rows = keys // n_users
+
+        indptr = np.zeros(n_users + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_users), out=indptr[1:])
+        return indptr, (keys % n_users).astype(self.targets.dtype), weights
+
+    def _window(self, start=None, end=None):
+        """Return the sources and targets of the edges from start up to end."""
+        if start is None and end is None:
+            return self.sources, self.targets
+        if self.times is None:
+            raise ValueError("The graph was built without `created_at`, so it cannot be queried by time")
+
+        first = 0 if start is None else np.searchsorted(self.times, pd.Timestamp(start).value, side='left')
+        last = len(self.times) if end is None else np.searchsorted(self.times, pd.Timestamp(end).value, side='left')
+        return self.sources[first:last], self.targets[first:last]
+
+    def adjacency(self, start=None, end=None):
+        """Return the adjacency matrix, optionally of a time window only.
+
+        Args:
+            start (str or pd.Timestamp, optional): first time to include
+            end (str or pd.Timestamp, optional): first time to exclude
+
+        Returns:
+            tuple: `indptr`, `indices` and `data` arrays of the CSR matrix,
+                with rows and columns in the order of `users`
+        """
+        if start is None and end is None:
+            return self.indptr, self.indices, self.data
+        return self._csr(*self._window(start, end))
+
+    def to_scipy(self, start=None, end=None):
+        """Return the adjacency matrix as a `scipy.sparse.csr_matrix` (needs SciPy)."""
+        from scipy.sparse import csr_matrix
+
+        indptr, indices, data = self.adjacency(start, end)
+        return csr_matrix((data, indices, indptr), shape=(self.n_users, self.n_users))
+
+    def out_degree(self, start=None, end=None, distinct=False):
+        """Number of mentions made by every user.
+
+        Args:
+            start, end: optional time window, as in `adjacency`
+            distinct (bool): count the different users mentioned instead
+
+        Returns:
+            pd.Series: degree per user
+        """
+        if distinct:
+            degree = np.diff(self.adjacency(start, end)[0])
+        else:
+            degree = np.bincount(self._window(start, end)[0], minlength=self.n_users)
+        return pd.Series(degree, index=self.users, name='out_degree')
+
+    def in_degree(self, start=None, end=None, distinct=False):
+        """Number of times every user is mentioned.
+
+        Args:
+            start, end: optional time window, as in `adjacency`
+            distinct (bool): count the different users mentioning them instead
+
+        Returns:
+            pd.Series: degree per user
+        """
+        if distinct:
+            degree = np.bincount(self.adjacency(start, end)[1], minlength=self.n_users)
+        else:
+            degree = np.bincount(self._window(start, end)[1], minlength=self.n_users)
+        return pd.Series(degree, index=self.users, name='in_degree')
+
+    def top_mentioned(self, k=10, author=None, start=None, end=None):
+        """Return the k most mentioned users.
+
+        Args:
+            k (int): number of users
+            author (str, optional): only count mentions by this user
+            start, end: optional time window, as in `adjacency`
+
+        Returns:
+            pd.Series: number of mentions of the top users, most mentioned first
+        """
+        if author is None:
+            users, weights = np.arange(self.n_users), self.in_degree(start, end).to_numpy()
+        else:
+            row = self.users.get_loc(author.lstrip('@').lower())
+            indptr, indices, data = self.adjacency(start, end)
+            users, weights = indices[indptr[row]:indptr[row + 1]], data[indptr[row]:indptr[row + 1]]
+
+        # Only sort the k largest
+        k = min(k, len(weights))
+        top = np.argpartition(-weights, k - 1)[:k] if 0 < k < len(weights) else np.arange(k)
+        top = top[np.lexsort((users[top], -weights[top]))]
+
+        result = pd.Series(weights[top], index=self.users[users[top]], name='mentions')
+        return result[result > 0]
+
+
+def _encode_strings(values):
+    """Encode strings as UTF-8 into lengths and one buffer (None/NaN as '')."""
+    values = ['' if not isinstance(value, str) else value for value in values]
+    encoded = list(map(str.encode, values))
+    return np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), b''.join(encoded)
+
+
+def _decode_strings(offsets, buffer):
+    """Decode the strings between consecutive offsets of a UTF-8 buffer."""
+    buffer = bytes(buffer[offsets[0]:offsets[-1]])
+    starts, ends = (offsets[:-1] - offsets[0]).tolist(), (offsets[1:] - offsets[0]).tolist()
+    return list(map(bytes.decode, map(buffer.__getitem__, map(slice, starts, ends))))
+
+
+class ColumnWriter:
+    """Write a tweet DataFrame to disk column by column, in row groups.
+
+    Every column is stored as plain binary files in a folder, next to a
+    `meta.json` file with the types of the columns and, for every row
+    group, the first and last `created_at`. That allows `read_columns` to
+    load only some columns, and only the row groups within a time window.
+    Strings are stored as offsets into one UTF-8 buffer, and lists of
+    strings (like `tweet_mentions`) as offsets into such a string column.
+    Frames can be appended one after the other, e.g. chunk by chunk.
+
+    `meta.json` is only written by `close`, so a folder whose writing was
+    interrupted (e.g. by an error inside the `with` block) cannot be read.
+
+    Example:
+        >>> import tempfile
+        >>> folder = tempfile.mkdtemp()
+        >>> df = pd.DataFrame({
+        ...     'created_at': pd.DatetimeIndex(['2016-01-01 10:00', '2017-03-02 11:00', None, '2017-06-01 09:30'],
+        ...                                    dtype='datetime64[ns]').tz_localize('Europe/Amsterdam'),
+        ...     'text': ['Mars', None, 'Tesla', 'SpaceX'],
+        ...     'tweet_mentions': [['@NASA'], [], ['@Tesla', '@SpaceX'], []],
+        ...     'year': pd.Categorical([2016, 2017, None, 2017]),
+        ...     'n_mentions': [1, 0, 2, 0]})
+        >>> with ColumnWriter(folder, row_group_size=2) as writer:
+        ...     _ = writer.append(df.iloc[:3]).append(df.iloc[3:])
+        >>> read_columns(folder).equals(df)
+        True
+        >>> read_columns(folder, ['text', 'n_mentions'], start='2017-01-01')  # only rows in the window
+             text  n_mentions
+        0     NaN           0
+        1  SpaceX           0
+        >>> with ColumnWriter(folder) as writer:  # a chunk can have no categories at all
+        ...     _ = writer.append(pd.DataFrame({'year': pd.Categorical([None])})).append(df[['year']])
+        >>> read_columns(folder)['year'].tolist()
+        [nan, 2016, 2017, nan, 2017]
+    """
+
+    def __init__(self, path, time_column='created_at', row_group_size=2**20):
+        """
+        Args:
+            path (str): folder to write to (created if needed); existing
+                column files in it are overwritten
+            time_column (str): datetime column to keep the range of per
+                row group, for `start` and `end` in `read_columns`
+            row_group_size (int): maximum number of rows per row group
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+        # The old frame in the folder is invalid as soon as its files are overwritten
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            os.remove(os.path.join(path, 'meta.json'))
+        self.row_group_size = row_group_size
+        self.meta = {'n_rows': 0, 'time_column': time_column, 'index': None,
+                     'columns': dict(), 'row_groups': []}
+        self._files = dict()
+        self._ends = dict()
+
+    def _write(self, name, buffer):
+        if name not in self._files:
+            self._files[name] = open(os.path.join(self.path, name), 'wb')
+        self._files[name].write(buffer)
+
+    def _write_offsets(self, name, lengths):
+        """Write the end offsets of the next items, continuing where the last chunk ended."""
+        if name not in self._ends:
+            self._ends[name] = 0
+            self._write(name, np.zeros(1, dtype=np.int64).tobytes())
+        offsets = np.cumsum(lengths, dtype=np.int64) + self._ends[name]
+        if len(offsets):
+            self._ends[name] = int(offsets[-1])
+        self._write(name, offsets.tobytes())
+
+    @staticmethod
+    def _describe(values):
+        """Return how a column is stored: its kind and, for arrays, its NumPy type."""
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return {'kind': 'category', 'categories': [], 'order': []}
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            return {'kind': 'datetime', 'tz': str(values.dtype.tz)}
+        if pd.api.types.is_datetime64_dtype(values.dtype):
+            return {'kind': 'datetime', 'tz': None}
+        if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biuf':
+            return {'kind': 'array', 'dtype': values.dtype.str}
+        if isinstance(values.dtype, pd.StringDtype):
+            return {'kind': 'string'}
+
+        if values.dtype == object:
+            inferred = pd.api.types.infer_dtype(values, skipna=True)
+            if inferred in ('string', 'empty'):
+                return {'kind': 'string'}
+            if all(isinstance(value, (list, tuple, np.ndarray)) for value in values.dropna()):
+                return {'kind': 'list'}
+
+        # E.g. nullable Int64 or boolean columns, whose missing values an array cannot hold
+        raise TypeError(f"Cannot store column {values.name!r} of type {values.dtype}")
+
+    def _append_column(self, name, values, column):
+        kind = column['kind']
+
+        if kind == 'array':
+            self._write(name, np.ascontiguousarray(values.to_numpy(), dtype=column['dtype']).tobytes())
+
+        elif kind == 'datetime':
+            times = pd.DatetimeIndex(values)
+            if column['tz'] is not None:
+                times = times.tz_convert('UTC').tz_localize(None)
+            self._write(name, times.as_unit('ns').asi8.tobytes())
+
+        elif kind == 'category':
+            # Codes refer to the categories of all chunks written so far
+            categories = pd.Index(column['categories'])
+            new = values.cat.categories.difference(categories, sort=False)
+            column['categories'] = categories.append(new).tolist()
+            codes = pd.Index(column['categories']).get_indexer(values.cat.categories)
+
+            # Order of the categories when read; sorted if every chunk had them sorted (e.g. years)
+            order = pd.Index(column['order']).append(new)
+            if pd.Index(column['order']).is_monotonic_increasing and values.cat.categories.is_monotonic_increasing:
+                order = order.sort_values()
+            column['order'] = order.tolist()
+            if len(codes):
+                codes = np.where(values.cat.codes >= 0, codes[values.cat.codes], -1)
+            else:  # no categories, so all values are missing (e.g. calendar features of NaT)
+                codes = np.full(len(values), -1)
+            self._write(name, codes.astype(np.int32).tobytes())
+
+        elif kind == 'string':
+            lengths, buffer = _encode_strings(values.tolist())
+            self._write(name + '.valid', values.notna().to_numpy(np.uint8).tobytes())
+            self._write_offsets(name + '.offsets', lengths)
+            self._write(name + '.values', buffer)
+
+        else:
+            lists = [value if isinstance(value, (list, tuple, np.ndarray)) else [] for value in values]
+            lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+            value_lengths, buffer = _encode_strings(itertools.chain.from_iterable(lists))
+            self._write(name + '.valid', values.notna().to_numpy(np.uint8).tobytes())
+            self._write_offsets(name + '.offsets', lengths)
+            self._write_offsets(name + '.value_offsets', value_lengths)
+            self._write(name + '.values', buffer)
+
+    def append(self, df):
+        """Append the rows of a frame, which has the same columns as the first one.
+
+        Columns must hold numbers, datetimes, categories, strings or lists;
+        other types (e.g. nullable `Int64` or `boolean`) raise a TypeError
+        and have to be converted with `astype` first.
+
+        Args:
+            df (pd.DataFrame): the rows
+
+        Returns:
+            ColumnWriter: the object itself
+        """
+        if not self.meta['columns']:
+            # The index is stored as ordinary columns, unless it is just the row numbers
+            if not isinstance(df.index, pd.RangeIndex):
+                self.meta['index'] = list(df.reset_index().columns[:df.index.nlevels])
+            frame = df.reset_index() if self.meta['index'] else df
+            self.meta['columns'] = {name: self._describe(frame[name]) for name in frame.columns}
+        else:
+            frame = df.reset_index() if self.meta['index'] else df
+
+        if list(frame.columns) != list(self.meta['columns']):
+            raise ValueError(f"Columns {list(frame.columns)} differ from {list(self.meta['columns'])}")
+
+        time_column = self.meta['time_column']
+        with _gc_paused():
+            for start in range(0, len(frame), self.row_group_size):
+                chunk = frame.iloc[start:start + self.row_group_size]
+                row_group = {'start': self.meta['n_rows'], 'stop': self.meta['n_rows'] + len(chunk)}
+
+                if time_column in chunk.columns:
+                    times = pd.DatetimeIndex(chunk[time_column])
+                    row_group['min'] = None if times.isna().all() else int(times.min().value)
+                    row_group['max'] = None if times.isna().all() else int(times.max().value)
+
+                for name, column in self.meta['columns'].items():
+                    self._append_column(name, chunk[name], column)
+
+                self.meta['row_groups'].append(row_group)
+                self.meta['n_rows'] = row_group['stop']
+
+        return self
+
+    def close(self):
+        # Create the files of columns that never had rows
+        for name, column in self.meta['columns'].items():
+            if column['kind'] in ('string', 'list'):
+                self._write_offsets(name + '.offsets', [])
+                self._write(name + '.valid', b'')
+                self._write(name + '.values', b'')
+                if column['kind'] == 'list':
+                    self._write_offsets(name + '.value_offsets', [])
+            else:
+                self._write(name, b'')
+
+        self._close_files()
+
+        meta_path = os.path.join(self.path, 'meta.json')
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def _close_files(self):
+        for file in self._files.values():
+            file.close()
+        self._files = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        # After an error the frame is incomplete: leave it without meta.json
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_files()
+
+
+def write_columns(df, path, time_column='created_at', row_group_size=2**20):
+    """Write a DataFrame in the format of `ColumnWriter`, see there."""
+    with ColumnWriter(path, time_column=time_column, row_group_size=row_group_size) as writer:
+        writer.append(df)
+
+
+def _map_file(path, name, dtype):
+    """Memory-map a column file (empty files cannot be mapped)."""
+    file_path = os.path.join(path, name)
+    if os.path.getsize(file_path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(file_path, dtype=dtype, mode='r')
+
+
+def _read_column(path, name, column, ranges):
+    """Read the rows in a list of (start, stop) ranges of a column."""
+    kind = column['kind']
+
+    if kind in ('array', 'datetime', 'category'):
+        dtype = {'array': column.get('dtype'), 'datetime': np.int64, 'category': np.int32}[kind]
+        data = _map_file(path, name, dtype)
+        values = np.concatenate([data[start:stop] for start, stop in ranges])
+
+        if kind == 'datetime':
+            values = pd.DatetimeIndex(values.view('datetime64[ns]'))
+            return values.tz_localize('UTC').tz_convert(column['tz']) if column['tz'] else values
+        if kind == 'category':
+            values = pd.Categorical.from_codes(values, categories=column['categories'])
+            return values.reorder_categories(column['order'])
+        return values
+
+    valid = np.concatenate([_map_file(path, name + '.valid', np.uint8)[start:stop]
+                            for start, stop in ranges]).astype(bool)
+    offsets = _map_file(path, name + '.offsets', np.int64)
+    buffer = _map_file(path, name + '.values', np.uint8)
+
+    if kind == 'string':
+        values = list(itertools.chain.from_iterable(
+            _decode_strings(offsets[start:stop + 1], buffer) for start, stop in ranges))
+        values = np.array(values, dtype=object)
+        values[~valid] = None
+        return values
+
+    value_offsets = _map_file(path, name + '.value_offsets', np.int64)
+    values = []
+    for start, stop in ranges:
+        lengths = np.diff(offsets[start:stop + 1]).tolist()
+        strings = iter(_decode_strings(value_offsets[offsets[start]:offsets[stop] + 1], buffer))
+        values.extend(map(list, map(itertools.islice, itertools.repeat(strings), lengths)))
+
+    values = np.fromiter(values, dtype=object, count=len(values))
+    values[~valid] = None
+    return values
+
+
+def read_columns(path, columns=None, start=None, end=None):
+    """Read a frame written by `ColumnWriter`, or part of it.
+
+    Only the files of the requested columns are read, and with `start` or
+    `end` only the row groups that overlap with that time window.
+
+    Args:
+        path (str): folder with the frame
+        columns (list, optional): columns to read (default: all)
+        start (str or pd.Timestamp, optional): first time to include
+        end (str or pd.Timestamp, optional): first time to exclude
+
+    Returns:
+        pd.DataFrame: the requested rows and columns
+    """
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+
+    index = meta['index'] or []
+    names = list(meta['columns']) if columns is None else index + [name for name in columns if name not in index]
+    time_column = meta['time_column']
+    windowed = start is not None or end is not None
+
+    if windowed and time_column not in meta['columns']:
+        raise ValueError(f"The frame has no {time_column!r} column to select a time window on")
+
+    # Row groups that can contain rows within the window, merged into ranges
+    low = np.iinfo(np.int64).min if start is None else pd.Timestamp(start).value
+    high = np.iinfo(np.int64).max if end is None else pd.Timestamp(end).value
+    ranges = []
+    for row_group in meta['row_groups']:
+        if windowed and (row_group['min'] is None or row_group['max'] < low or row_group['min'] >= high):
+            continue
+        if ranges and ranges[-1][1] == row_group['start']:
+            ranges[-1] = (ranges[-1][0], row_group['stop'])
+        else:
+            ranges.append((row_group['start'], row_group['stop']))
+    ranges = ranges or [(0, 0)]
+
+    with _gc_paused():
+        data = {name: _read_column(path, name, meta['columns'][name], ranges) for name in names}
+        df = pd.DataFrame(data, columns=names)
+
+        if windowed:
+            # Times are stored as nanoseconds since 1970 (UTC for time zone aware columns)
+            times = np.concatenate([_map_file(path, time_column, np.int64)[start:stop] for start, stop in ranges])
+            df = df[(times >= low) & (times < high) & (times != pd.NaT.value)]
+
+        if index:
+            df = df.set_index(index)
+        elif windowed:
+            df = df.reset_index(drop=True)
+
+    return df
+
+
+# Types of the columns of a tweet export like data/elonmusk_tweets.csv
+TWEET_DTYPES = {'id': np.int64, 'text': str}
+TWEET_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def read_tweets_chunked(file_path, chunk_size=100000, date_format=TWEET_DATE_FORMAT):
+    """Read a CSV file with tweets in chunks, with the types already parsed.
+
+    `id` is read as int64 and `created_at` as datetime while reading, so no
+    second pass with `pd.to_datetime` is needed.
+
+    Args:
+        file_path (str): path to the CSV file
+        chunk_size (int): number of tweets per chunk
+        date_format (str): format of `created_at`, or None to infer it
+
+    Yields:
+        pd.DataFrame: the next chunk of tweets
+    """
+    yield from pd.read_csv(file_path, encoding='utf-8', chunksize=chunk_size, dtype=TWEET_DTYPES,
+                           parse_dates=['created_at'], date_format=date_format)
+
+
+def clean_tweets(chunk, tokenizer=tokenizer):
+    """Add the columns of the notebooks computed from the text of the tweets.
+
+    Args:
+        chunk (pd.DataFrame): tweets with a `text` column
+        tokenizer (TweetTokenizer): tokenizer for `clean_text`
+
+    Returns:
+        pd.DataFrame: the tweets with `clean_text` (notebook 5) and
+            `tweet_mentions` and `n_mentions` (notebook 4) added
+    """
+    texts = chunk['text'].fillna('')
+    chunk = chunk.assign(clean_text=tokenize_tweets(texts, tokenizer=tokenizer))
+
+    columns = extract_entities(texts, return_columns=True)[1]
+    return chunk.assign(tweet_mentions=columns['tweet_mentions'], n_mentions=columns['n_mentions'])
+
+
+def ingest_tweets(file_path, target_path, steps=None, chunk_size=100000):
+    """Process a large CSV file with tweets chunk by chunk.
+
+    Only one chunk is in memory at a time: it is read with
+    `read_tweets_chunked`, passed through every step and appended to
+    `target_path` with a `ColumnWriter`, so the result can be loaded (in
+    part) with `read_columns`.
+
+    Example:
+        ingest_tweets('data/elonmusk_tweets.csv', 'stuff/musk_tweets_clean')
+        df = read_columns('stuff/musk_tweets_clean', columns=['created_at', 'clean_text'])
+
+    Args:
+        file_path (str): path to the CSV file
+        target_path (str): folder to write the result to
+        steps (tuple, optional): functions that take a chunk and return it
+            processed (default: `clean_tweets` and `add_calendar_features`)
+        chunk_size (int): number of tweets per chunk
+
+    Returns:
+        int: number of tweets processed
+    """
+    if steps is None:
+        steps = (clean_tweets, add_calendar_features)
+
+    with ColumnWriter(target_path, row_group_size=chunk_size) as writer:
+        for chunk in read_tweets_chunked(file_path, chunk_size=chunk_size):
+            for step in steps:
+                chunk = step(chunk)
+            writer.append(chunk)
+
+        return writer.meta['n_rows']
+
+
+WEEKDAY_NAMES = np.array(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'],
+                         dtype=object)
+NS_PER_HOUR = 3600 * 10**9
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+
+def calendar_features(created_at):
+    """Compute the calendar columns of the notebooks in one pass.
+
+    Instead of `.dt.weekday`, `.dt.day_name()`, `.dt.hour` and so on (or
+    `day_of_week` with `apply`), the weekday and hour are computed with
+    integer arithmetic on the timestamps, and the names are looked up in
+    an array. All columns are categorical, with all possible values as
+    categories (e.g. all weekdays in order from Monday).
+
+    Args:
+        created_at (pd.Series): timestamps of the tweets (time zone aware
+            timestamps are used in their own time zone)
+
+    Returns:
+        pd.DataFrame: the columns `week_day` (0 is Monday), `week_day_name`,
+            `day_hour`, `month` and `year`, with the index of `created_at`
+    """
+    times = pd.DatetimeIndex(created_at)
+    if times.tz is not None:
+        times = times.tz_localize(None)
+
+    nanoseconds = times.as_unit('ns').asi8
+    missing = times.isna()
+
+    # 1 January 1970 was a Thursday (weekday 3)
+    week_day = (nanoseconds // NS_PER_DAY + 3) % 7
+    day_hour = nanoseconds // NS_PER_HOUR % 24
+    months = times.values.astype('datetime64[M]').astype(np.int64)
+    year, month = months // 12 + 1970, months % 12 + 1
+
+    first_year, last_year = (year[~missing].min(), year[~missing].max()) if (~missing).any() else (1970, 1969)
+
+    def categorical(codes, categories):
+        return pd.Categorical.from_codes(np.where(missing, -1, codes), categories=categories)
+
+    return pd.DataFrame({
+        'week_day': categorical(week_day, np.arange(7)),
+        'week_day_name': categorical(week_day, WEEKDAY_NAMES),
+        'day_hour': categorical(day_hour, np.arange(24)),
+        'month': categorical(month - 1, np.arange(1, 13)),
+        'year': categorical(year - first_year, np.arange(first_year, last_year + 1)),
+    }, index=created_at.index if isinstance(created_at, pd.Series) else None)
+
+
+def add_calendar_features(chunk):
+    """Add the columns of `calendar_features` of `created_at` to a frame (a step for `ingest_tweets`)."""
+    return chunk.assign(**calendar_features(chunk['created_at']))
+
+
+def load_tweets(file_path='data/elonmusk_tweets.csv', cache_path='stuff/elonmusk_tweets', columns=None,
+                start=None, end=None):
+    """Load tweets with the columns added in the notebooks, computed only once.
+
+    The first time, the CSV file is processed with `ingest_tweets` and the
+    result is stored in `cache_path`; after that (until the CSV file
+    changes) the tweets are read from there with `read_columns`. Remove the
+    folder to compute the columns again.
+
+    Args:
+        file_path (str): path to the CSV file
+        cache_path (str): folder for the processed tweets
+        columns, start, end: passed on to `read_columns`
+
+    Returns:
+        pd.DataFrame: the tweets, with `clean_text`, `tweet_mentions`,
+            `n_mentions` and the columns of `calendar_features`
+    """
+    meta_path = os.path.join(cache_path, 'meta.json')
+    if not os.path.exists(meta_path) or os.path.getmtime(meta_path) < os.path.getmtime(file_path):
+        ingest_tweets(file_path, cache_path)
+
+    return read_columns(cache_path, columns=columns, start=start, end=end)
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+# Integer types from small to large, to downcast to the smallest that fits
+INTEGER_TYPES = ('int8', 'int16', 'int32', 'int64')
+
+
+def _is_string_column(values):
+    """Check if a column holds strings (and not e.g. lists)."""
+    if isinstance(values.dtype, pd.StringDtype):
+        return True
+    return values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) == 'string'
+
+
+def plan_dtypes(df):
+    """Find smaller types for the columns of a DataFrame.
+
+    Integer columns get the smallest integer type that holds all their
+    values (e.g. `male_cast` fits in int8), and string columns whose
+    values repeat become categorical when that takes less memory (e.g.
+    `companies` or `week_day_name`). Other columns keep their type.
+
+    The plan is a dict that can be given to `df.astype` or, to get the
+    smaller types straight away on later files, to `pd.read_csv`:
+
+        plan = plan_dtypes(df)
+        df = pd.read_csv('data/academyawards.csv', dtype=plan)
+
+    It is plain JSON, so it can also be saved with `json.dump`. Note that
+    a later file with larger numbers than the planned type can hold cannot
+    be read with the plan.
+
+    Args:
+        df (pd.DataFrame): the frame to inspect
+
+    Returns:
+        dict: column (key) and the name of its new type (value), only for
+            columns whose type changes
+    """
+    plan = dict()
+
+    for name in df.columns:
+        values = df[name]
+
+        if pd.api.types.is_integer_dtype(values.dtype) and isinstance(values.dtype, np.dtype):
+            low, high = (values.min(), values.max()) if len(values) else (0, 0)
+            for dtype in INTEGER_TYPES:
+                if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                    break
+            if np.dtype(dtype).itemsize < values.dtype.itemsize:
+                plan[name] = dtype
+
+        elif _is_string_column(values) and values.nunique() < len(values):
+            as_category = values.astype('category')
+            if as_category.memory_usage(deep=True) < values.memory_usage(deep=True):
+                plan[name] = 'category'
+
+    return plan
+
+
+def memory_report(df, plan):
+    """Compare the memory use of a frame before and after applying a plan.
+
+    Args:
+        df (pd.DataFrame): the frame, with its original types
+        plan (dict): types as returned by `plan_dtypes`
+
+    Returns:
+        pd.DataFrame: per column the type and memory in bytes before and
+            after, and the bytes saved, with a `total` row at the end
+    """
+    planned = df.astype(plan)
+
+    report = pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'new_dtype': planned.dtypes.astype(str),
+        'bytes': df.memory_usage(deep=True, index=False),
+        'new_bytes': planned.memory_usage(deep=True, index=False),
+    })
+    report['saved'] = report['bytes'] - report['new_bytes']
+    report.loc['total'] = ['', '', report['bytes'].sum(), report['new_bytes'].sum(), report['saved'].sum()]
+
+    return report
+
+
+if __name__ == "__main__":
+
+    academy_awards = pd.read_csv('data/academyawards.csv', encoding='utf-8')
+    plan = plan_dtypes(academy_awards)
+    print(plan)
+    print(memory_report(academy_awards, plan))
+
+    # The plan is reused at load time
+    print(pd.read_csv('data/academyawards.csv', encoding='utf-8', dtype=plan).dtypes)